@@ -1,14 +1,38 @@
+import asyncio
+import inspect
+import os
+import json
+import time
+from functools import lru_cache
 from os import getenv
-from fastapi import FastAPI, Request, Depends
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, RedirectResponse
+from typing import Optional
+from fastapi import FastAPI, Request, Depends, Header, HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import HTMLResponse, RedirectResponse, PlainTextResponse, JSONResponse
+import anyio.to_thread
 import uvicorn
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models.database import get_db, SessionLocal
-from app.utils.auth import bootstrap_key_user, get_user_from_cookie
+from app.utils.startup import startup_timer
+from app.models.database import get_async_db, SessionLocal, engine, async_engine, DATABASE_PATH, init_schema
+from app.utils.auth import bootstrap_key_user, get_user_from_cookie_async, auth_cache
 from app.utils.network import check_wifi_connected, setup_ap_mode, is_raspberry_pi_zero
+from app.utils.device_registry import device_registry, entry_from_notice
+from app.utils.device_identity import DeviceIdentityError, SERVER_TIME_HEADER
+from app.utils.hit_buffer import WRITE_BEHIND_ENABLED, hit_buffer
+from app.utils.hit_log import HIT_LOG_ENABLED, hit_log
+from app.utils.udp_ingest import UDP_PORT, start_udp_listener
+from app.utils.change_feed import change_feed
+from app.utils.device_channels import device_channels
+from app.utils.notifications import notification_bus
+from app.utils.password_pool import password_pool
+from app.utils.workers import WORKERS, PRIMARY_RETRY_INTERVAL, acquire_primary
+from app.utils.static_assets import PrecompressedStaticFiles, static_url
+from app.utils.metrics import (
+    METRICS_ENABLED, METRICS_TOKEN, MetricsMiddleware, Gauge, register, render_metrics, instrument_engine,
+    metrics_authorized
+)
 from app.routers import device, admin, auth
 
 # Create FastAPI app with enhanced documentation
@@ -35,17 +59,154 @@ app = FastAPI(
     ]
 )
 
-# Mount static files
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
+# Mount static files (fingerprinted, precompressed copies when `python -m app.utils.static_assets` has been run)
+app.mount("/static", PrecompressedStaticFiles(directory="app/static"), name="static")
 
-# Setup Jinja2 templates
-templates = Jinja2Templates(directory="app/templates")
+@lru_cache(maxsize=None)
+def get_templates():
+    """Jinja2 templates, set up on the first page view rather than at startup"""
+    from fastapi.templating import Jinja2Templates
+    templates = Jinja2Templates(directory="app/templates")
+    templates.env.globals["static_url"] = static_url
+    return templates
 
 # Include routers
 app.include_router(device.router)
 app.include_router(admin.router)
 app.include_router(auth.router)
 
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware, routes=app.routes)
+    instrument_engine(engine)
+    instrument_engine(async_engine)
+    
+    def threadpool_statistics():
+        # anyio's default limiter is per event loop; scrapes run on the server's loop
+        return anyio.to_thread.current_default_thread_limiter().statistics()
+    
+    register(Gauge("wsmd_sse_subscribers", "Connected SSE dashboards", lambda: change_feed.subscriber_count))
+    register(Gauge("wsmd_device_websockets", "Open device WebSocket channels", lambda: device_channels.connection_count))
+    register(Gauge("wsmd_threadpool_busy_threads", "Worker threads running sync handlers and blocking calls",
+                   lambda: threadpool_statistics().borrowed_tokens))
+    register(Gauge("wsmd_threadpool_queue_depth", "Calls waiting for a free worker thread",
+                   lambda: threadpool_statistics().tasks_waiting))
+    
+    if not METRICS_TOKEN:
+        print("Warning: /metrics is served without authentication; set WSMD_METRICS_TOKEN to require a token")
+    
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    async def metrics(authorization: Optional[str] = Header(None)):
+        """Prometheus metrics in the text exposition format"""
+        if not metrics_authorized(authorization):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid metrics token",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.exception_handler(DeviceIdentityError)
+async def device_identity_error_handler(request: Request, exc: DeviceIdentityError):
+    """Reject a bad device signature; the server time lets the firmware correct its clock"""
+    return JSONResponse(
+        status_code=401,
+        content={"detail": exc.detail},
+        headers={SERVER_TIME_HEADER: str(int(time.time()))}
+    )
+
+@app.exception_handler(RequestValidationError)
+async def request_validation_error_handler(request: Request, exc: RequestValidationError):
+    """FastAPI's 422 response, with inputs JSON cannot carry (NaN, Infinity) sent as strings"""
+    errors = jsonable_encoder(exc.errors())
+    for error in errors:
+        try:
+            json.dumps(error.get("input"), allow_nan=False)
+        except ValueError:
+            error["input"] = repr(error["input"])
+    return JSONResponse(status_code=422, content={"detail": errors})
+
+async def apply_device_notice(payload):
+    """Another worker created or changed a device"""
+    device_registry.put_entry(payload["mac_address"], entry_from_notice(payload))
+    change_feed.mark_changed()
+    if "config" in payload:
+        await device_channels.push(payload["mac_address"], payload["config"])
+
+def apply_user_notice(payload):
+    """Another worker created a user or changed a password"""
+    auth_cache.invalidate_user(payload["username"])
+    change_feed.mark_changed()
+
+notification_bus.on("device", apply_device_notice)
+notification_bus.on("user", apply_user_notice)
+
+PRIMARY_LOCK_PATH = f"{DATABASE_PATH}.primary.lock"
+
+async def start_primary_duties():
+    """Prune change notices and own the UDP port (exactly one worker does this)"""
+    notification_bus.prune = True
+    if UDP_PORT:
+        app.state.udp_transport = await start_udp_listener()
+
+async def wait_for_primary():
+    """Retry the election so a surviving worker takes over if the primary exits"""
+    while not acquire_primary(PRIMARY_LOCK_PATH):
+        await asyncio.sleep(PRIMARY_RETRY_INTERVAL)
+    print(f"Worker {os.getpid()} took over as primary")
+    await start_primary_duties()
+
+startup_timer.mark("imported")
+
+@app.on_event("startup")
+async def start_background_tasks():
+    """Create or upgrade the schema, then start background workers and optional listeners"""
+    init_schema()
+    startup_timer.mark("schema")
+    
+    # With several workers, one of them owns the UDP port and pruning of change notices
+    is_primary = WORKERS == 1 or acquire_primary(PRIMARY_LOCK_PATH)
+    device_registry.start()
+    startup_timer.mark("registry")
+    notification_bus.start()
+    if WRITE_BEHIND_ENABLED:
+        hit_buffer.start()
+    if HIT_LOG_ENABLED:
+        hit_log.start()
+    if is_primary:
+        await start_primary_duties()
+    else:
+        app.state.primary_task = asyncio.create_task(wait_for_primary())
+    startup_timer.mark("ready")
+    startup_timer.report()
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    """Stop listeners and background workers and flush any buffered state"""
+    primary_task = getattr(app.state, "primary_task", None)
+    if primary_task is not None:
+        primary_task.cancel()
+    udp_transport = getattr(app.state, "udp_transport", None)
+    if udp_transport is not None:
+        udp_transport.close()
+    # A failing step (e.g. a final flush that cannot be written) must not skip the others
+    steps = [
+        ("write-behind flush", hit_buffer.stop if WRITE_BEHIND_ENABLED else None),
+        ("hit log flush", hit_log.stop if HIT_LOG_ENABLED else None),
+        ("notification bus", notification_bus.stop),
+        ("change feed", change_feed.close),
+        ("device registry", device_registry.stop),
+        ("password pool", password_pool.shutdown),
+    ]
+    for name, step in steps:
+        if step is None:
+            continue
+        try:
+            result = step()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            print(f"Error stopping {name}: {e}")
+
 @app.get("/", response_class=HTMLResponse)
 async def root():
     """Redirect root to login page"""
@@ -54,20 +215,20 @@ async def root():
 @app.get("/login", response_class=HTMLResponse)
 async def login_page(request: Request):
     """Render login page"""
-    return templates.TemplateResponse("login.html", {"request": request})
+    return get_templates().TemplateResponse("login.html", {"request": request})
 
 @app.get("/dashboard", response_class=HTMLResponse)
-async def dashboard_page(request: Request, db: Session = Depends(get_db)):
+async def dashboard_page(request: Request, db: AsyncSession = Depends(get_async_db)):
     """Render dashboard page with authentication check"""
     # Check if user is authenticated using cookie
-    user = get_user_from_cookie(request, db)
+    user = await get_user_from_cookie_async(request, db)
     
     if not user:
         # Redirect to login page if not authenticated
         return RedirectResponse(url="/login", status_code=303)
     
     # User is authenticated, render dashboard with user info
-    return templates.TemplateResponse(
+    return get_templates().TemplateResponse(
         "dashboard.html", 
         {
             "request": request, 
@@ -78,6 +239,9 @@ async def dashboard_page(request: Request, db: Session = Depends(get_db)):
 
 def startup_tasks():
     """Perform startup tasks before running the app"""
+    # The key user lives in the database, so make sure the schema is current first
+    init_schema()
+    
     # Get database session
     db = SessionLocal()
     
@@ -101,10 +265,13 @@ if __name__ == "__main__":
     # Run startup tasks
     startup_tasks()
     
-    # Run the server
+    # Run the server. Reload and multiple workers need an import string, which
+    # makes uvicorn import and build the app again; otherwise pass this one.
+    reload = getenv("ENV") == "development"
     uvicorn.run(
-        "app.main:app",
+        app if WORKERS == 1 and not reload else "app.main:app",
         host="0.0.0.0",
         port=8000,
-        reload=getenv("ENV") == "development"
+        reload=reload,
+        workers=WORKERS
     )
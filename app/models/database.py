@@ -1,6 +1,10 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, text
+from os import getenv
+from sqlalchemy import create_engine, event, Column, Integer, String, Boolean, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.utils.workers import process_lock
 
 Base = declarative_base()
 
@@ -19,22 +23,120 @@ class Device(Base):
     mac_address = Column(String, unique=True, index=True)
     hit_counter = Column(Integer, default=0)
     max_hits = Column(Integer, default=9)
-    order = Column(Integer, default=0)
+    order = Column(Integer, default=0, index=True)
     name = Column(String, nullable=True)
 
+def default_device_name(mac_address, order):
+    """Generate the default display name for a device"""
+    return f"Device-{mac_address[-6:].replace(':', '')}-O{order}"
+
+class HitEvent(Base):
+    __tablename__ = "hit_events"
+    
+    id = Column(Integer, primary_key=True)
+    device_id = Column(Integer, index=True)
+    timestamp = Column(Integer, index=True)  # Unix seconds (UTC)
+
+class HitRollupMinute(Base):
+    __tablename__ = "hit_rollup_minute"
+    
+    device_id = Column(Integer, primary_key=True)
+    bucket = Column(Integer, primary_key=True)  # Unix seconds at the start of the minute
+    hits = Column(Integer, default=0)
+
+class ChangeNotice(Base):
+    """Change published by one worker process for the others (see app/utils/notifications.py)"""
+    __tablename__ = "change_notices"
+    # Workers skip ids they have seen, so ids must keep growing even after a prune empties the table
+    __table_args__ = {"sqlite_autoincrement": True}
+    
+    id = Column(Integer, primary_key=True)
+    origin = Column(Integer)  # PID of the publishing process
+    topic = Column(String)
+    payload = Column(String)  # JSON
+    created_at = Column(Integer, index=True)  # Unix seconds
+
+class DeviceNonce(Base):
+    """Signed-request nonce seen by any worker process (see app/utils/device_identity.py)"""
+    __tablename__ = "device_nonces"
+    
+    mac_address = Column(String, primary_key=True)
+    nonce = Column(String, primary_key=True)
+    expires_at = Column(Integer, index=True)  # Unix seconds
+
+class HitRollupHour(Base):
+    __tablename__ = "hit_rollup_hour"
+    
+    device_id = Column(Integer, primary_key=True)
+    bucket = Column(Integer, primary_key=True)  # Unix seconds at the start of the hour
+    hits = Column(Integer, default=0)
+
+# SQLite storage profile applied to every connection.
+# "performance" enables WAL so the dashboard and SSE readers don't block the hit writer;
+# "default" leaves SQLite's stock settings untouched.
+SQLITE_PROFILE = getenv("WSMD_SQLITE_PROFILE", "performance")
+SQLITE_BUSY_TIMEOUT_MS = int(getenv("WSMD_SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(getenv("WSMD_SQLITE_MMAP_SIZE", str(64 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(getenv("WSMD_SQLITE_CACHE_SIZE_KB", "8192"))
+
+def sqlite_pragmas(profile=SQLITE_PROFILE):
+    """Return the PRAGMA statements for a storage profile"""
+    if profile != "performance":
+        # journal_mode is stored in the database file, so switch it back explicitly
+        return ["PRAGMA journal_mode=DELETE"]
+    return [
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+        f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}",  # Negative values are KiB
+    ]
+
+def apply_sqlite_profile(sqlite_engine, profile=SQLITE_PROFILE):
+    """Run the storage profile's PRAGMAs on every new connection of a (sync) engine"""
+    pragmas = sqlite_pragmas(profile)
+    
+    @event.listens_for(sqlite_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+def create_sqlite_engine(url, profile=SQLITE_PROFILE):
+    """Create an SQLite engine that applies the storage profile on every new connection"""
+    sqlite_engine = create_engine(url, connect_args={"check_same_thread": False})
+    apply_sqlite_profile(sqlite_engine, profile)
+    return sqlite_engine
+
+def create_async_sqlite_engine(url, profile=SQLITE_PROFILE):
+    """Create an aiosqlite-backed async engine with the same storage profile"""
+    sqlite_engine = create_async_engine(url)
+    apply_sqlite_profile(sqlite_engine.sync_engine, profile)
+    return sqlite_engine
+
 # Create SQLite database engine
-SQLALCHEMY_DATABASE_URL = "sqlite:///./wsmd.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+DATABASE_PATH = getenv("WSMD_DATABASE_PATH", "./wsmd.db")
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{DATABASE_PATH}"
+engine = create_sqlite_engine(SQLALCHEMY_DATABASE_URL)
+
+# Async engine on the same file for the hot request paths
+ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{DATABASE_PATH}"
+async_engine = create_async_sqlite_engine(ASYNC_DATABASE_URL)
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+# create_all() skips existing tables, so indexes added later are created here
+def create_missing_indexes(bind=engine):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
 
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 # Create trigger to reset hit_counter when it reaches max_hits
-def create_reset_trigger():
-    with engine.begin() as conn:
+def create_reset_trigger(bind=engine):
+    with bind.begin() as conn:
         # Drop the trigger if it exists to avoid errors when restarting the app
         conn.execute(text("DROP TRIGGER IF EXISTS reset_hit_counter"))
         
@@ -50,8 +152,36 @@ def create_reset_trigger():
         """))
         # begin() handles the commit automatically
 
-# Create the trigger
-create_reset_trigger()
+# Stored in PRAGMA user_version (0 for databases created before versioning).
+# Bump whenever tables, indexes or the trigger change so existing databases are upgraded.
+SCHEMA_VERSION = 3
+
+def get_schema_version(bind=engine):
+    with bind.connect() as conn:
+        return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+def init_schema(bind=engine):
+    """Bring the database schema up to SCHEMA_VERSION; returns True if anything was done.
+    
+    A current database costs one PRAGMA read, so this is called on every
+    start instead of at import. Creation is serialized across processes.
+    """
+    if get_schema_version(bind) >= SCHEMA_VERSION:
+        return False
+    with process_lock(f"{DATABASE_PATH}.schema.lock"):
+        # Another process may have finished while we waited for the lock
+        version = get_schema_version(bind)
+        if version >= SCHEMA_VERSION:
+            return False
+        if version < 2:
+            # change_notices gained AUTOINCREMENT; its rows only live for a minute, so recreate it
+            ChangeNotice.__table__.drop(bind=bind, checkfirst=True)
+        Base.metadata.create_all(bind=bind)
+        create_missing_indexes(bind)
+        create_reset_trigger(bind)
+        with bind.begin() as conn:
+            conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return True
 
 # Dependency to get DB session
 def get_db():
@@ -60,3 +190,9 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# Dependency to get an async DB session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
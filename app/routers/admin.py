@@ -1,14 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, Form, Request
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Form, Request, Query, Header, status
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 import asyncio
-import json
-from typing import List
+import time
+from typing import List, Literal, Optional
 from pydantic import BaseModel, Field
 
-from app.models.database import User, Device, get_db
-from app.utils.auth import get_key_user, get_password_hash, get_current_user_from_cookie, get_key_user_from_cookie
+from app.models.database import User, Device, default_device_name, get_db, get_async_db
+from app.utils.hit_buffer import hit_buffer
+from app.utils.hit_log import get_hit_history
+from app.utils.change_feed import change_feed, create_event
+from app.utils.http_cache import etag_matches
+from app.utils.device_channels import device_channels
+from app.utils.device_registry import device_registry, device_notice
+from app.utils.notifications import notification_bus
+from app.utils.password_pool import password_pool, PasswordPoolBusy
+from app.utils.auth import (
+    get_current_user_from_cookie, get_key_user_from_cookie,
+    get_current_user_from_cookie_async, get_key_user_from_cookie_async, auth_cache
+)
 
 # Pydantic models for request/response validation and documentation
 class DeviceModel(BaseModel):
@@ -29,6 +42,10 @@ class UserModel(BaseModel):
     class Config:
         from_attributes = True
 
+class HitBucketModel(BaseModel):
+    timestamp: int = Field(..., description="Start of the bucket in Unix seconds (UTC)")
+    hits: int = Field(..., description="Number of hits recorded in the bucket")
+
 class MessageResponse(BaseModel):
     message: str = Field(..., description="Response message")
 
@@ -43,23 +60,27 @@ router = APIRouter(
     },
 )
 
+# Largest values the device protocols can carry (UDP acks send order as uint16, max_hits as uint32)
+MAX_DEVICE_ORDER = 0xFFFF
+MAX_DEVICE_MAX_HITS = 0xFFFFFFFF
+
 @router.post("/device", response_model=MessageResponse, summary="Update Device Properties")
-def update_device(
+async def update_device(
     request: Request,
     mac_address: str = Form(...),
-    order: int = Form(...),
-    max_hits: int = Form(...),
+    order: int = Form(..., ge=1, le=MAX_DEVICE_ORDER),
+    max_hits: int = Form(..., ge=1, le=MAX_DEVICE_MAX_HITS),
     name: str = Form(None),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user_from_cookie)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_from_cookie_async)
 ):
     """
     Update multiple properties for a specific device.
     
     Parameters:
     - **mac_address**: MAC address of the device to update
-    - **order**: New order value to assign
-    - **max_hits**: New maximum hit count value
+    - **order**: New order value to assign (1-65535)
+    - **max_hits**: New maximum hit count value (1-4294967295)
     - **name**: New name for the device (optional)
     
     Returns a success message.
@@ -70,24 +91,53 @@ def update_device(
     Note:
     - If name is not provided, a name will be auto-generated based on MAC address and order
     """
-    device = db.query(Device).filter(Device.mac_address == mac_address).first()
-    if not device:
-        raise HTTPException(status_code=404, detail="Device not found")
-    
-    # Update device properties
-    device.order = order
-    device.max_hits = max_hits
-    
-    if name:
-        device.name = name
-    elif not device.name:
-        # Auto-generate name if none provided and none exists
-        device.name = f"Device-{mac_address[-6:].replace(':', '')}-O{order}"
+    # Flush buffered hits first so the update sees (and the trigger can reset) the real counter;
+    # hits for this device wait without blocking the event loop
+    async with hit_buffer.paused(mac_address):
+        device = (await db.execute(select(Device).where(Device.mac_address == mac_address))).scalars().first()
+        if not device:
+            raise HTTPException(status_code=404, detail="Device not found")
+        
+        # Update device properties
+        device.order = order
+        device.max_hits = max_hits
+        
+        if name:
+            device.name = name
+        elif not device.name:
+            # Auto-generate name if none provided and none exists
+            device.name = default_device_name(mac_address, order)
+        
+        await db.commit()
+        await db.refresh(device)
+        device_registry.put(device)
+        change_feed.mark_changed()
     
-    db.commit()
+    # Push the new configuration to the device if it is connected over WebSocket
+    config = {
+        "type": "config",
+        "counter": device.hit_counter,
+        "max_hits": device.max_hits,
+        "order": device.order,
+        "name": device.name
+    }
+    await device_channels.push(mac_address, config)
+    # Other worker processes update their registries and push to devices connected to them
+    await notification_bus.publish_async("device", {**device_notice(device), "config": config})
     
     return {"message": "Device properties updated successfully"}
 
+def hash_password_or_429(password):
+    """Hash a password on the shared password pool, refusing with 429 when it is saturated"""
+    try:
+        return password_pool.hash_blocking(password)
+    except PasswordPoolBusy:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Password service busy, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+
 @router.post("/user", response_model=MessageResponse, summary="Create New User")
 def create_user(
     request: Request,
@@ -109,6 +159,7 @@ def create_user(
     
     Raises:
     - 400 Bad Request: If the username already exists or there's an error creating the user
+    - 429 Too Many Requests: If the password pool is saturated (e.g. during a login burst)
     """
     # Check if username already exists
     existing_user = db.query(User).filter(User.username == username).first()
@@ -116,7 +167,7 @@ def create_user(
         raise HTTPException(status_code=400, detail="Username already exists")
     
     # Create new user
-    hashed_password = get_password_hash(password)
+    hashed_password = hash_password_or_429(password)
     new_user = User(
         username=username,
         password_hash=hashed_password,
@@ -126,6 +177,9 @@ def create_user(
     try:
         db.add(new_user)
         db.commit()
+        auth_cache.invalidate_user(username)
+        change_feed.mark_changed()
+        notification_bus.publish("user", {"username": username})
         return {"message": "User created successfully"}
     except IntegrityError:
         db.rollback()
@@ -150,112 +204,91 @@ def update_user_password(
     
     Raises:
     - 404 Not Found: If the user with the given username doesn't exist
+    - 429 Too Many Requests: If the password pool is saturated (e.g. during a login burst)
     """
     user = db.query(User).filter(User.username == username).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    user.password_hash = get_password_hash(password)
+    user.password_hash = hash_password_or_429(password)
     db.commit()
+    auth_cache.invalidate_user(username)
+    notification_bus.publish("user", {"username": username})
     
     return {"message": "Password updated successfully"}
 
-# Helper function to get formatted device data
-def get_device_data(db: Session):
-    devices = db.query(Device).all()
-    return [{
-        "mac_address": device.mac_address,
-        "order": device.order,
-        "hit_counter": device.hit_counter,
-        "max_hits": device.max_hits,
-        "name": device.name
-    } for device in devices]
-
-# Helper function to get formatted user data
-def get_user_data(db: Session, is_key_user: bool):
-    if not is_key_user:
-        return None
-    users = db.query(User).all()
-    return [{"id": user.id, "username": user.username, "is_key_user": user.is_key_user} for user in users]
+# Seconds without a change before a heartbeat is sent
+HEARTBEAT_INTERVAL = 15
 
-# Helper function to create SSE event message
-def create_event(event_name, data):
-    return f"event: {event_name}\ndata: {json.dumps(data)}\n\n"
+async def wait_for_disconnect(request: Request):
+    """Return once the client has gone away"""
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
 
 # Generate SSE events
-async def generate_sse_events(request: Request, db: Session, current_user: User):
+async def generate_sse_events(request: Request, current_user: User, last_event_id: Optional[str] = None):
     # Send connection established event
-    yield "event: connected\ndata: Connection established\n\n"
+    yield b"event: connected\ndata: Connection established\n\n"
     
-    # Get initial data
-    is_key_user = current_user.is_key_user
-    
-    # Initial data payload
-    users_data = get_user_data(db, is_key_user)
-    if users_data:
-        yield create_event("users", users_data)
-    
-    devices_data = get_device_data(db)
-    yield create_event("devices", devices_data)
-    
-    # Track last known state to avoid sending duplicate data
-    last_devices_hash = hash(str(devices_data))
-    last_users_hash = hash(str(users_data)) if users_data else None
-    heartbeat_counter = 0
+    # The shared feed queues a full snapshot (or the missed deltas when resuming), then only changes
+    queue = await change_feed.subscribe(
+        include_users=current_user.is_key_user,
+        last_event_id=last_event_id
+    )
+    # Waiting on the queue and the disconnect together drops a closed tab
+    # right away instead of at the next heartbeat
+    disconnected = asyncio.ensure_future(wait_for_disconnect(request))
+    next_event = None
     
     try:
-        # Continue sending updates
         while True:
-            # Check if client disconnected
-            if await request.is_disconnected():
+            next_event = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait(
+                {next_event, disconnected}, timeout=HEARTBEAT_INTERVAL, return_when=asyncio.FIRST_COMPLETED
+            )
+            if disconnected in done:
                 print(f"Client disconnected: {request.client.host}")
                 break
-            
-            # Check for device updates
-            new_devices_data = get_device_data(db)
-            current_devices_hash = hash(str(new_devices_data))
-            if current_devices_hash != last_devices_hash:
-                yield create_event("devices", new_devices_data)
-                last_devices_hash = current_devices_hash
-            
-            # Check for user updates if key user
-            if is_key_user:
-                new_users_data = get_user_data(db, True)
-                current_users_hash = hash(str(new_users_data))
-                if current_users_hash != last_users_hash:
-                    yield create_event("users", new_users_data)
-                    last_users_hash = current_users_hash
-            
-            # Send heartbeat periodically
-            heartbeat_counter += 1
-            if heartbeat_counter >= 5:  # Every 5 iterations (3s * 5 = 15s)
+            if next_event in done:
+                yield next_event.result()
+            else:
+                next_event.cancel()
                 yield create_event("heartbeat", {"timestamp": asyncio.get_event_loop().time()})
-                heartbeat_counter = 0
-            
-            # Wait before checking for updates again
-            await asyncio.sleep(3)
             
     except Exception as e:
         # Log the error and notify the client
         print(f"SSE error: {str(e)}")
         yield create_event("error", {"message": str(e)})
+    finally:
+        disconnected.cancel()
+        if next_event is not None:
+            next_event.cancel()
+        change_feed.unsubscribe(queue)
 
 @router.get("/events", summary="Server-Sent Events Stream")
 async def sse_events(
     request: Request,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user_from_cookie)
+    last_event_id: Optional[str] = Query(None, description="Resume after this event id (for clients that cannot send headers)"),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+    current_user: User = Depends(get_current_user_from_cookie_async)
 ):
     """
     Establishes a Server-Sent Events (SSE) connection for real-time updates.
     
     The endpoint streams device and user data updates in real-time without requiring polling.
     
+    Every data event carries an `id:`. The stream starts with full `devices` (and, for key
+    users, `users`) snapshots; afterwards only `devices-patch` events with the changed and
+    removed devices are sent, plus a full `users` event when users change.
+    
+    A client reconnecting with `Last-Event-ID` (or `?last_event_id=`) receives only the
+    events it missed, or full snapshots if it has fallen too far behind.
+    
     Returns:
     - A streaming response containing JSON-formatted events for device and user data
     """
     return StreamingResponse(
-        generate_sse_events(request, db, current_user), 
+        generate_sse_events(request, current_user, last_event_id_header or last_event_id), 
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -264,32 +297,70 @@ async def sse_events(
         }
     )
 
+def snapshot_response(request, body, etag):
+    """Serve a shared JSON snapshot, or 304 if the client already has this version"""
+    # no-cache: browsers may store the list but must revalidate before reusing it
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 @router.get("/devices", response_model=List[DeviceModel], summary="Get All Devices")
-def get_all_devices(
+async def get_all_devices(
     request: Request,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user_from_cookie)
+    current_user: User = Depends(get_current_user_from_cookie_async)
 ):
     """
     Retrieve a list of all devices in the system.
     
     Returns a list of all registered devices with their current status information.
+    
+    The list is the JSON snapshot shared with the SSE stream: it is re-read and
+    encoded only after the database has changed. The response carries an ETag
+    derived from its content; a request whose If-None-Match still matches gets
+    304 Not Modified with no body.
     """
-    devices = db.query(Device).all()
-    return devices
+    feed = await change_feed.snapshot()
+    return snapshot_response(request, feed.devices_json, feed.devices_etag)
 
 @router.get("/users", response_model=List[UserModel], summary="Get All Users")
-def get_all_users(
+async def get_all_users(
     request: Request,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_key_user_from_cookie)
+    current_user: User = Depends(get_key_user_from_cookie_async)
 ):
     """
     Retrieve a list of all users in the system.
     
     Returns information about all users including their ID, username, and privilege level.
     
-    This endpoint requires key user privileges.
+    This endpoint requires key user privileges. Like the device list, it is served
+    from the snapshot shared with the SSE stream and answers If-None-Match with
+    304 Not Modified.
+    """
+    feed = await change_feed.snapshot()
+    return snapshot_response(request, feed.users_json, feed.users_etag)
+
+
+@router.get("/devices/{mac_address}/history", response_model=List[HitBucketModel], summary="Get Device Hit History")
+def get_device_history(
+    mac_address: str,
+    resolution: Literal["minute", "hour"] = Query("hour", description="Bucket size"),
+    hours: int = Query(24, ge=1, description="How many hours of history to return"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_cookie)
+):
+    """
+    Retrieve hit counts for a device bucketed per minute or per hour.
+    
+    History is served from the rollup tables, which keep counting across max_hits resets.
+    Minute buckets are kept for a limited time; hourly buckets are kept indefinitely.
+    
+    Raises:
+    - 404 Not Found: If the device with the given MAC address doesn't exist
     """
-    users = db.query(User).all()
-    return users
+    device = db.query(Device).filter(Device.mac_address == mac_address).first()
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+    
+    since = int(time.time()) - hours * 3600
+    return get_hit_history(db, device.id, resolution, since)
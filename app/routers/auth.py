@@ -1,24 +1,44 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Response
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 
-from app.models.database import get_db
-from app.utils.auth import authenticate_user, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.models.database import User, get_async_db
+from app.utils.auth import create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.utils.password_pool import password_pool, PasswordPoolBusy
 
 router = APIRouter(tags=["auth"])
 
 @router.post("/token")
-def login_for_access_token(
+async def login_for_access_token(
     response: Response,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Generate a JWT token for authenticated users and set it as a cookie
+
+    The bcrypt check runs on the shared password pool. When its queue is
+    full the login is refused with 429 instead of waiting, and hashes made
+    with an outdated cost are upgraded after a successful check.
     """
-    user = authenticate_user(db, form_data.username, form_data.password)
-    if not user:
+    result = await db.execute(select(User).where(User.username == form_data.username))
+    user = result.scalars().first()
+    valid = False
+    if user:
+        try:
+            valid, new_hash = await password_pool.verify_and_update(form_data.password, user.password_hash)
+        except PasswordPoolBusy:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many login attempts, try again shortly",
+                headers={"Retry-After": "1"},
+            )
+        if valid and new_hash:
+            user.password_hash = new_hash
+            await db.commit()
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -1,10 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, status, Body
-from sqlalchemy.orm import Session
-from typing import Dict, Any
-from pydantic import BaseModel, Field
+from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+import json
+import time
+from typing import Annotated, List, Optional
+from pydantic import BaseModel, Field, model_validator
 
-from app.models.database import Device, get_db
-from app.utils.network import get_client_mac, next_available_order
+from app.models.database import Device, AsyncSessionLocal, default_device_name, get_async_db
+from app.utils.network import get_client_mac_async, insert_device_with_next_order
+from app.utils.hits import apply_hits, get_device_by_mac
+from app.utils.hit_log import HIT_TIME_MAX_SKEW
+from app.utils.change_feed import change_feed
+from app.utils.device_channels import DeviceChannel, device_channels
+from app.utils.device_registry import device_registry, device_notice
+from app.utils.notifications import notification_bus
+from app.utils.device_identity import DeviceIdentityError
+from app.utils.startup import startup_timer
 
 # Create Pydantic models for request/response validation and documentation
 class OrderResponse(BaseModel):
@@ -16,6 +27,42 @@ class HitCounterResponse(BaseModel):
     max_hits: int = Field(..., description="The maximum allowed hits for the device")
     order: int = Field(..., description="The current order assigned to the device")
 
+# Upper bound on hits accepted in one batch request
+MAX_BATCH_HITS = 10000
+# Oldest hit age accepted; ESP8266 millis() wraps after about 49.7 days, so firmware ages never exceed it
+MAX_HIT_AGE_MS = 2**32 - 1
+
+class HitBatchRequest(BaseModel):
+    count: int = Field(..., ge=1, le=MAX_BATCH_HITS, description="Number of hits to apply")
+    timestamps: Optional[List[Annotated[float, Field(ge=0, allow_inf_nan=False)]]] = Field(
+        None, description="Unix time (seconds) of each hit"
+    )
+    ages_ms: Optional[List[Annotated[int, Field(ge=0, le=MAX_HIT_AGE_MS)]]] = Field(
+        None, description="Milliseconds elapsed since each hit"
+    )
+    
+    @model_validator(mode="after")
+    def check_timestamps(self):
+        for values in (self.timestamps, self.ages_ms):
+            if values is not None and len(values) > self.count:
+                raise ValueError("More timestamps than hits")
+        # Checked here (before any hit is applied) so a bad time is a 422, not a 500 after the commit
+        if self.timestamps and max(self.timestamps) > time.time() + HIT_TIME_MAX_SKEW:
+            raise ValueError("Hit timestamp is in the future")
+        return self
+    
+    def hit_timestamps(self):
+        """Return per-hit Unix timestamps, converting ages relative to now"""
+        if self.timestamps:
+            return self.timestamps
+        if self.ages_ms:
+            now = time.time()
+            return [now - age / 1000 for age in self.ages_ms]
+        return None
+
+class BatchHitResponse(HitCounterResponse):
+    accepted: int = Field(..., description="The number of hits applied")
+
 # Create router with more detailed description
 router = APIRouter(
     prefix="/device",
@@ -24,11 +71,12 @@ router = APIRouter(
 )
 
 @router.post("/hit", response_model=HitCounterResponse, summary="Increment Hit Counter")
-def increment_hit_counter(request: Request, db: Session = Depends(get_db)):
+async def increment_hit_counter(request: Request, db: AsyncSession = Depends(get_async_db)):
     """
     Increment the hit counter for a device identified by its MAC address.
     
-    The MAC address is automatically detected from the client's connection.
+    The MAC address is taken from signed identity headers (X-WSMD-MAC, -Timestamp, -Nonce,
+    -Signature) when WSMD_DEVICE_SECRET is set, otherwise detected from the client's connection.
     
     Returns:
     - The updated hit counter value
@@ -37,57 +85,92 @@ def increment_hit_counter(request: Request, db: Session = Depends(get_db)):
     
     Raises:
     - 400 Bad Request: If the device MAC address cannot be determined or the device is not found
+    - 401 Unauthorized: If the identity headers are present but the signature does not verify
     
-    Note: When hit_counter reaches max_hits, it will be automatically reset to 0 by the database trigger.
-    A device name is automatically generated if not already present.
+    Note: When hit_counter reaches max_hits, it is reset to 0 (the rule the database trigger also enforces).
+    Devices are looked up in memory, so unregistered MACs are rejected without a database query.
+    With write-behind enabled (WSMD_WRITE_BEHIND=1) the counter is answered from memory
+    and written to the database in periodic batches.
     """
     # Get client MAC address
-    mac_address = get_client_mac(request)
+    mac_address = await get_client_mac_async(request)
     if not mac_address:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Could not determine device MAC address"
         )
     
-    # Find device in database or create new entry
-    device = db.query(Device).filter(Device.mac_address == mac_address).first()
-    
-    if not device:
-         raise HTTPException(
+    result = await apply_hits(db, mac_address)
+    if result is None:
+        raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Device not found"
         )
-    else:
-        # If device doesn't have a name, generate one
-        if not device.name:
-            device.name = f"Device-{mac_address[-6:].replace(':', '')}-O{device.order}"
-        
-        device.hit_counter += 1
     
-    db.commit()
+    if not startup_timer.first_hit_seen:
+        startup_timer.first_hit()
+    return result
+
+@router.post("/hits", response_model=BatchHitResponse, summary="Apply a Batch of Hits")
+async def increment_hit_counter_batch(
+    batch: HitBatchRequest,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Apply several hits for a device in one request, e.g. hits buffered by the device while offline.
+    
+    The MAC address is taken from signed identity headers (X-WSMD-MAC, -Timestamp, -Nonce,
+    -Signature) when WSMD_DEVICE_SECRET is set, otherwise detected from the client's connection.
     
-    # After commit, we need to refresh the device to get the actual hit_counter value
-    # in case the trigger reset it to 0
-    db.refresh(device)
+    Parameters:
+    - **count**: Number of hits to apply
+    - **timestamps**: Optional Unix time (seconds) of each hit
+    - **ages_ms**: Optional milliseconds elapsed since each hit, for devices without a real-time clock
     
-    # Return response
-    return {
-        "counter": device.hit_counter,
-        "max_hits": device.max_hits,
-        "order": device.order
-    }
+    All hits are applied in a single transaction. The counter rolls over at max_hits exactly
+    as if the hits had been sent one at a time. Hits without a timestamp are recorded at the
+    time the request is received.
+    
+    Returns:
+    - The updated hit counter value, max hits and order
+    - The number of hits accepted
+    
+    Raises:
+    - 400 Bad Request: If the device MAC address cannot be determined or the device is not found
+    - 401 Unauthorized: If the identity headers are present but the signature does not verify
+    - 422 Unprocessable Entity: If count is out of range, or a timestamp is not finite, negative or in
+      the future, or an age is negative or over MAX_HIT_AGE_MS (nothing is applied)
+    """
+    mac_address = await get_client_mac_async(request)
+    if not mac_address:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Could not determine device MAC address"
+        )
+    
+    result = await apply_hits(db, mac_address, batch.count, batch.hit_timestamps())
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Device not found"
+        )
+    
+    return {**result, "accepted": batch.count}
 
 @router.post("/register", response_model=OrderResponse, summary="Request Order Assignment")
-def register_device(
+async def register_device(
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Register a device and assign an order number.
     
-    The MAC address is automatically detected from the client's connection.
+    The MAC address is taken from signed identity headers (X-WSMD-MAC, -Timestamp, -Nonce,
+    -Signature) when WSMD_DEVICE_SECRET is set, otherwise detected from the client's connection.
     
-    - The next available order number will be assigned
+    - The next available order number will be assigned (atomically, so devices
+      registering at the same time never share an order)
     - If the device already exists, it will return the existing order
     - A device name is automatically generated if not already present
     
@@ -96,9 +179,10 @@ def register_device(
     
     Raises:
     - 400 Bad Request: If the device MAC address cannot be determined
+    - 401 Unauthorized: If the identity headers are present but the signature does not verify
     """
     # Get client MAC address
-    mac_address = get_client_mac(request)
+    mac_address = await get_client_mac_async(request)
     if not mac_address:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -107,30 +191,113 @@ def register_device(
 
     
     # Find device in database or create new entry
-    device = db.query(Device).filter(Device.mac_address == mac_address).first()
+    result = await db.execute(select(Device).where(Device.mac_address == mac_address))
+    device = result.scalars().first()
+    changed = False
     
     if not device:
-        assigned_order = next_available_order(db)
-        # Generate a default name based on MAC address and order
-        default_name = f"Device-{mac_address[-6:].replace(':', '')}-O{assigned_order}"
-            
-        device = Device(
-            mac_address=mac_address,
-            hit_counter=0,
-            order=assigned_order,
-            name=default_name
-        )
-        db.add(device)
-    else:
+        device = await insert_device_with_next_order(db, mac_address)
+        changed = device is not None
+        if device is None:
+            # A concurrent request registered this MAC first; return its order
+            result = await db.execute(select(Device).where(Device.mac_address == mac_address))
+            device = result.scalars().first()
+    elif not device.name:
         # If device doesn't have a name, generate one
-        if not device.name:
-            device.name = f"Device-{mac_address[-6:].replace(':', '')}-O{device.order}"
+        device.name = default_device_name(mac_address, device.order)
+        await db.commit()
+        changed = True
     
-    # Save changes
-    db.commit()
+    device_registry.put(device)
+    if changed:
+        change_feed.mark_changed()
+        # Other worker processes add the device to their registries
+        await notification_bus.publish_async("device", device_notice(device))
     
     # Return response
     return {
         "order": device.order,
         "assigned": device.order
     }
+
+@router.websocket("/ws")
+async def device_channel(websocket: WebSocket):
+    """
+    Persistent channel for a device to report hits without a new connection per hit.
+    
+    The MAC address is resolved once when the connection opens; unknown devices are
+    rejected. The server then sends the device's configuration:
+    
+        {"type": "config", "counter": 3, "max_hits": 9, "order": 1, "name": "..."}
+    
+    and the device streams hits, each answered with an ack:
+    
+        -> {"type": "hit", "seq": 42, "count": 1}
+        <- {"type": "ack", "seq": 42, "counter": 4, "max_hits": 9, "order": 1}
+    
+    When an admin changes the device, a new "config" message is pushed. Messages
+    are JSON text frames; a binary frame closes the channel with 1003.
+    """
+    try:
+        mac_address = await get_client_mac_async(websocket)
+    except DeviceIdentityError:
+        mac_address = None
+    if not mac_address:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    await device_registry.ensure_loaded()
+    device = None
+    async with AsyncSessionLocal() as db:
+        if await device_registry.lookup(db, mac_address) is not None:
+            device = await get_device_by_mac(db, mac_address)
+    if not device:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    await websocket.accept()
+    channel = DeviceChannel(websocket)
+    device_channels.add(mac_address, channel)
+    
+    try:
+        await channel.send({
+            "type": "config",
+            "counter": device.hit_counter,
+            "max_hits": device.max_hits,
+            "order": device.order,
+            "name": device.name
+        })
+        
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", status.WS_1000_NORMAL_CLOSURE))
+            if frame.get("text") is None:
+                await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA)
+                break
+            try:
+                message = json.loads(frame["text"])
+            except ValueError:
+                message = None
+            if not isinstance(message, dict) or message.get("type") != "hit":
+                await channel.send({"type": "error", "detail": "Unsupported message"})
+                continue
+            
+            count = message.get("count", 1)
+            # bool is an int subclass: reject true/false rather than counting them as 1/0
+            if isinstance(count, bool) or not isinstance(count, int) or not 1 <= count <= MAX_BATCH_HITS:
+                await channel.send({"type": "error", "seq": message.get("seq"), "detail": "Invalid hit count"})
+                continue
+            
+            async with AsyncSessionLocal() as db:
+                result = await apply_hits(db, mac_address, count)
+            if result is None:
+                await channel.send({"type": "error", "seq": message.get("seq"), "detail": "Device not found"})
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+                break
+            
+            await channel.send({"type": "ack", "seq": message.get("seq"), **result})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        device_channels.remove(mac_address, channel)
@@ -32,11 +32,25 @@ function updateUIForUserRole(isKeyUser) {
   });
 }
 
+// ETag of the last list received from each endpoint
+const listETags = {};
+
+// Fetch a list endpoint; resolves to null if it has not changed since the last call
+async function fetchListIfChanged(url) {
+  const headers = listETags[url] ? { "If-None-Match": listETags[url] } : {};
+  // no-store: handle 304 here instead of letting the browser cache replay the old body
+  const response = await fetchWithAuth(url, { headers, cache: "no-store" });
+  if (response.status === 304 || !response.ok) {
+    return null;
+  }
+  listETags[url] = response.headers.get("ETag");
+  return response.json();
+}
+
 async function loadDevices() {
   try {
-    const response = await fetchWithAuth("/admin/devices");
-    if (response.ok) {
-      const devices = await response.json();
+    const devices = await fetchListIfChanged("/admin/devices");
+    if (devices) {
       populateDeviceTable(devices);
       updateDeviceDropdowns(devices);
     }
@@ -47,9 +61,8 @@ async function loadDevices() {
 
 async function loadUsers() {
   try {
-    const response = await fetchWithAuth("/admin/users");
-    if (response.ok) {
-      const users = await response.json();
+    const users = await fetchListIfChanged("/admin/users");
+    if (users) {
       populateUserDropdown(users);
     }
   } catch (error) {
@@ -248,6 +261,10 @@ function setupEventSource() {
   const isKeyUser =
     document.getElementById("currentUser").dataset.isKeyUser === "true";
   let eventSource = null;
+  // Id of the last event applied, sent back on reconnect to receive only missed changes
+  let lastEventId = null;
+  // Current device list keyed by MAC address, kept up to date by patch events
+  const devicesByMac = new Map();
 
   // Update connection status
   function updateConnectionStatus(status, message) {
@@ -264,6 +281,14 @@ function setupEventSource() {
     }
   }
 
+  // Redraw the device table and dropdown from the current device map
+  function renderDevices() {
+    const devices = Array.from(devicesByMac.values());
+    populateDeviceTable(devices);
+    updateDeviceDropdowns(devices);
+    updateTimestamp();
+  }
+
   // Create a function to connect and handle reconnection
   function connect() {
     // Close existing connection if any
@@ -273,8 +298,11 @@ function setupEventSource() {
 
     updateConnectionStatus("connecting", "Connecting...");
 
-    // Create a new EventSource connection
-    eventSource = new EventSource("/admin/events");
+    // Create a new EventSource connection, resuming after the last event we saw
+    const url = lastEventId
+      ? `/admin/events?last_event_id=${encodeURIComponent(lastEventId)}`
+      : "/admin/events";
+    eventSource = new EventSource(url);
 
     // Handle connection open
     eventSource.onopen = function () {
@@ -282,18 +310,31 @@ function setupEventSource() {
       updateConnectionStatus("connected", "Connected (Live)");
     };
 
-    // Handle device updates
+    // Handle full device snapshots
     eventSource.addEventListener("devices", function (event) {
       const devices = JSON.parse(event.data);
-      populateDeviceTable(devices);
-      updateDeviceDropdowns(devices);
-      updateTimestamp();
+      devicesByMac.clear();
+      devices.forEach((device) => devicesByMac.set(device.mac_address, device));
+      lastEventId = event.lastEventId;
+      renderDevices();
+    });
+
+    // Handle device patches (only the changed and removed devices)
+    eventSource.addEventListener("devices-patch", function (event) {
+      const patch = JSON.parse(event.data);
+      patch.changed.forEach((device) =>
+        devicesByMac.set(device.mac_address, device)
+      );
+      patch.removed.forEach((mac) => devicesByMac.delete(mac));
+      lastEventId = event.lastEventId;
+      renderDevices();
     });
 
     // Handle user updates (for key users)
     if (isKeyUser) {
       eventSource.addEventListener("users", function (event) {
         const users = JSON.parse(event.data);
+        lastEventId = event.lastEventId;
         populateUserDropdown(users);
         updateTimestamp();
       });
@@ -1,39 +1,64 @@
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from os import getenv
+from typing import NamedTuple, Optional
 import getpass
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status, Request, Cookie
+import threading
+import time
+from functools import lru_cache
+from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models.database import User, get_db
+from app.models.database import User, get_db, get_async_db
 
 # Security configurations
 SECRET_KEY = "CHANGE_THIS_TO_A_SECURE_SECRET_IN_PRODUCTION"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 1440  # 24 hours
 
-# Password context for hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Verified cookie tokens are cached for at most this many seconds (and never past their exp)
+AUTH_CACHE_TTL = int(getenv("WSMD_AUTH_CACHE_TTL", "300"))
+AUTH_CACHE_MAX_ENTRIES = 1024
+
+# bcrypt cost factor; stored hashes with a different cost are rehashed on the next login
+BCRYPT_ROUNDS = int(getenv("WSMD_BCRYPT_ROUNDS", "12"))
+
+# passlib and jose are imported on first use rather than at startup, so a
+# restarted server answers devices before anyone logs in
+
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    """Password context for hashing, created on first use"""
+    from passlib.context import CryptContext
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=BCRYPT_ROUNDS,
+        bcrypt__min_rounds=BCRYPT_ROUNDS,
+        bcrypt__max_rounds=BCRYPT_ROUNDS
+    )
+
+def encode_token(claims):
+    """Sign claims as a JWT"""
+    from jose import jwt
+    return jwt.encode(claims, SECRET_KEY, algorithm=ALGORITHM)
+
+def decode_token(token):
+    """Return the claims of a valid, unexpired JWT, or None"""
+    from jose import JWTError, jwt
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
 
 # OAuth2 scheme for token validation
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def verify_password(plain_password, hashed_password):
-    """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
-
 def get_password_hash(password):
     """Generate a password hash"""
-    return pwd_context.hash(password)
-
-def authenticate_user(db: Session, username: str, password: str):
-    """Authenticate a user"""
-    user = db.query(User).filter(User.username == username).first()
-    if not user or not verify_password(password, user.password_hash):
-        return False
-    return user
+    return get_pwd_context().hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create a JWT access token"""
@@ -45,7 +70,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = encode_token(to_encode)
     return encoded_jwt
 
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
@@ -56,12 +81,11 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
+    payload = decode_token(token)
+    if payload is None:
+        raise credentials_exception
+    username: str = payload.get("sub")
+    if username is None:
         raise credentials_exception
     
     user = db.query(User).filter(User.username == username).first()
@@ -79,23 +103,101 @@ def get_key_user(current_user: User = Depends(get_current_user)):
         )
     return current_user
 
-def get_user_from_cookie(request: Request, db: Session = Depends(get_db)):
-    """Get the current user from JWT token in a cookie"""
+class AuthenticatedUser(NamedTuple):
+    """Snapshot of the user behind a verified cookie token"""
+    id: int
+    username: str
+    is_key_user: bool
+
+class AuthCache:
+    """Verified cookie tokens mapped to user snapshots.
+
+    Entries live until the token's ``exp`` or ``ttl`` seconds, whichever is
+    sooner, and are dropped when the user is changed via invalidate_user().
+    """
+    
+    def __init__(self, ttl=AUTH_CACHE_TTL, max_entries=AUTH_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}  # token -> (expires_at, AuthenticatedUser)
+        self._lock = threading.Lock()
+    
+    def get(self, token):
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            with self._lock:
+                self._entries.pop(token, None)
+            return None
+        return entry[1]
+    
+    def put(self, token, exp, user):
+        expires_at = min(exp, time.time() + self.ttl)
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                # Evict the oldest entry
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[token] = (expires_at, user)
+    
+    def invalidate_user(self, username):
+        """Drop every cached token of a user so the next request re-reads it"""
+        with self._lock:
+            for token in [t for t, (_, user) in self._entries.items() if user.username == username]:
+                del self._entries[token]
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+# Shared cache for cookie authentication
+auth_cache = AuthCache()
+
+def decode_cookie_token(request: Request):
+    """Return (token, payload) for a valid JWT token in the cookie, or (None, None)"""
     token = request.cookies.get("access_token")
     
     if not token:
+        return None, None
+    
+    payload = decode_token(token)
+    if payload is None or payload.get("sub") is None:
+        return None, None
+    return token, payload
+
+def cache_user(token, payload, user):
+    """Store a user snapshot for a verified token and return it"""
+    if user is None:
         return None
+    snapshot = AuthenticatedUser(id=user.id, username=user.username, is_key_user=user.is_key_user)
+    auth_cache.put(token, payload["exp"], snapshot)
+    return snapshot
+
+def get_user_from_cookie(request: Request, db: Session = Depends(get_db)):
+    """Get the current user from JWT token in a cookie"""
+    user = auth_cache.get(request.cookies.get("access_token"))
+    if user is not None:
+        return user
     
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            return None
-    except JWTError:
+    token, payload = decode_cookie_token(request)
+    if token is None:
         return None
     
-    user = db.query(User).filter(User.username == username).first()
-    return user
+    user = db.query(User).filter(User.username == payload["sub"]).first()
+    return cache_user(token, payload, user)
+
+async def get_user_from_cookie_async(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Get the current user from JWT token in a cookie using the async session"""
+    user = auth_cache.get(request.cookies.get("access_token"))
+    if user is not None:
+        return user
+    
+    token, payload = decode_cookie_token(request)
+    if token is None:
+        return None
+    
+    result = await db.execute(select(User).where(User.username == payload["sub"]))
+    return cache_user(token, payload, result.scalars().first())
 
 def get_current_user_from_cookie(request: Request, db: Session = Depends(get_db)):
     """Get the current user from JWT token in a cookie and verify authentication"""
@@ -108,6 +210,17 @@ def get_current_user_from_cookie(request: Request, db: Session = Depends(get_db)
         )
     return user
 
+async def get_current_user_from_cookie_async(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Async variant of get_current_user_from_cookie for async endpoints"""
+    user = await get_user_from_cookie_async(request, db)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
+
 def get_key_user_from_cookie(request: Request, db: Session = Depends(get_db)):
     """Check if the current user from cookie is a key user"""
     user = get_user_from_cookie(request, db)
@@ -124,6 +237,16 @@ def get_key_user_from_cookie(request: Request, db: Session = Depends(get_db)):
         )
     return user
 
+async def get_key_user_from_cookie_async(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Async variant of get_key_user_from_cookie for async endpoints"""
+    user = await get_current_user_from_cookie_async(request, db)
+    if not user.is_key_user:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions. Key user required."
+        )
+    return user
+
 def bootstrap_key_user(db: Session):
     """Bootstrap a key user if none exists"""
     # Check if any user exists
@@ -0,0 +1,52 @@
+import threading
+
+
+class PeriodicWorker:
+    """Daemon thread that calls ``func`` every ``interval`` seconds or when woken.
+
+    ``stop()`` runs ``func`` one last time after the thread exits so callers
+    can rely on it for a final flush. Pass ``final_run=False`` for work that
+    is pointless at shutdown; ``stop()`` then only ends the thread.
+    """
+
+    def __init__(self, name, interval, func, final_run=True):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.final_run = final_run
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stopping.is_set() and not self.final_run:
+                break
+            try:
+                self.func()
+            except Exception as e:
+                print(f"Error in {self.name}: {e}")
+
+    def wake(self):
+        """Run func as soon as possible instead of waiting for the interval"""
+        self._wake.set()
+
+    def start(self):
+        """Start the worker thread"""
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the worker thread and run func a final time (unless final_run is False)"""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.final_run:
+            self.func()
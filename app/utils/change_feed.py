@@ -0,0 +1,272 @@
+import asyncio
+import os
+import time
+from collections import deque
+from os import getenv
+
+from sqlalchemy import select
+
+from app.models.database import User, Device, AsyncSessionLocal, async_engine
+from app.utils.metrics import SSE_SERIALIZATION_LATENCY
+from app.utils.json_encoding import encode_json
+from app.utils.http_cache import etag_for
+
+# How often the shared loop checks PRAGMA data_version while anyone is subscribed
+CHANGE_POLL_INTERVAL_MS = int(getenv("WSMD_CHANGE_POLL_INTERVAL_MS", "500"))
+# How many past versions are kept for Last-Event-ID resume
+CHANGE_HISTORY_SIZE = int(getenv("WSMD_CHANGE_HISTORY_SIZE", "256"))
+SUBSCRIBER_QUEUE_SIZE = 64
+
+# Event ids are "<epoch>-<version>"; the epoch changes on every restart and
+# differs between worker processes, so a client resuming against another
+# process always gets a full snapshot
+FEED_EPOCH = f"{int(time.time()):x}.{os.getpid():x}"
+
+
+# Read-only list queries select plain columns so no ORM objects are built
+DEVICE_COLUMNS = select(Device.mac_address, Device.order, Device.hit_counter, Device.max_hits, Device.name)
+USER_COLUMNS = select(User.id, User.username, User.is_key_user)
+
+# Helper function to get formatted device data
+async def get_device_data(db):
+    return [dict(row) for row in (await db.execute(DEVICE_COLUMNS)).mappings()]
+
+# Helper function to get formatted user data
+async def get_user_data(db):
+    return [dict(row) for row in (await db.execute(USER_COLUMNS)).mappings()]
+
+
+def format_event(event_name, payload, event_id=None):
+    """Frame an already encoded JSON payload (bytes) as an SSE event"""
+    id_line = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{id_line}event: {event_name}\ndata: ".encode() + payload + b"\n\n"
+
+
+def create_event(event_name, data, event_id=None):
+    with SSE_SERIALIZATION_LATENCY.time():
+        return format_event(event_name, encode_json(data), event_id)
+
+
+def parse_event_id(event_id):
+    """Return the version from a Last-Event-ID of this process, or None"""
+    if not event_id:
+        return None
+    epoch, _, version = event_id.partition("-")
+    if epoch != FEED_EPOCH or not version.isdigit():
+        return None
+    return int(version)
+
+
+class ChangeFeed:
+    """One change-detection loop shared by every SSE subscriber.
+
+    While at least one subscriber is connected, a single task checks SQLite's
+    ``PRAGMA data_version`` on a dedicated connection. Only when another
+    connection has committed does it re-read devices and users. Each change
+    gets a new version: changed and removed devices go out once as a
+    ``devices-patch`` event, the (small) user list as a full ``users`` event.
+
+    The last ``history_size`` versions are kept so a reconnecting client can
+    replay only what it missed; anyone further behind gets full snapshots.
+
+    Every event and the device/user snapshots are encoded to JSON bytes once
+    per change; all subscribers and the list endpoints send the same bytes.
+    """
+
+    def __init__(self, interval_ms=CHANGE_POLL_INTERVAL_MS, history_size=CHANGE_HISTORY_SIZE):
+        self.interval = interval_ms / 1000
+        self._subscribers = {}  # queue -> wants user events
+        self._task = None
+        self._conn = None
+        self._data_version = None
+        self._poll_lock = asyncio.Lock()
+        self._history = deque(maxlen=history_size)  # (version, [(event_name, event)])
+        self.version = 0
+        self._devices = None  # mac_address -> row of the current snapshot
+        self._users = None
+        self.devices_json = None  # Encoded once per change, shared by SSE and the list endpoints
+        self.users_json = None
+        self.devices_event = None
+        self.users_event = None
+        self.devices_etag = None
+        self.users_etag = None
+        self._checked_at = 0.0  # Monotonic time of the last data_version check
+        self._stale = False  # Set by mark_changed() when this process wrote devices or users
+
+    @property
+    def event_id(self):
+        return f"{FEED_EPOCH}-{self.version}"
+
+    async def _poll(self):
+        """Read a new snapshot if the database changed; return the delta events"""
+        async with self._poll_lock:
+            if self._conn is None:
+                self._conn = await async_engine.connect()
+            try:
+                data_version = (await self._conn.exec_driver_sql("PRAGMA data_version")).scalar()
+            finally:
+                # Never hold a read transaction open between polls
+                await self._conn.rollback()
+            self._checked_at = time.monotonic()
+            if data_version == self._data_version and self._devices is not None:
+                return []
+            self._data_version = data_version
+
+            async with AsyncSessionLocal() as db:
+                devices_data = await get_device_data(db)
+                users_data = await get_user_data(db)
+
+            devices = {device["mac_address"]: device for device in devices_data}
+            first_snapshot = self._devices is None
+            changed_devices = [] if first_snapshot else [
+                device for mac, device in devices.items() if self._devices.get(mac) != device
+            ]
+            removed_devices = [] if first_snapshot else [mac for mac in self._devices if mac not in devices]
+            users_changed = not first_snapshot and users_data != self._users
+
+            if not first_snapshot and not (changed_devices or removed_devices or users_changed):
+                return []
+
+            self.version += 1
+            self._devices = devices
+            self._users = users_data
+            with SSE_SERIALIZATION_LATENCY.time():
+                self.devices_json = encode_json(devices_data)
+                self.users_json = encode_json(users_data)
+            self.devices_event = format_event("devices", self.devices_json, self.event_id)
+            self.users_event = format_event("users", self.users_json, self.event_id)
+            # Content-derived validators: unchanged lists keep their ETag across versions and workers
+            self.devices_etag = etag_for(self.devices_json)
+            self.users_etag = etag_for(self.users_json)
+            if first_snapshot:
+                return []
+
+            events = []
+            if changed_devices or removed_devices:
+                events.append(("devices-patch", create_event(
+                    "devices-patch",
+                    {"changed": changed_devices, "removed": removed_devices},
+                    self.event_id
+                )))
+            if users_changed:
+                events.append(("users", self.users_event))
+            self._history.append((self.version, events))
+            return events
+
+    def _snapshot_events(self, include_users):
+        events = [self.users_event] if include_users else []
+        events.append(self.devices_event)
+        return events
+
+    def _missed_events(self, last_version, include_users):
+        """Delta events after last_version, or None if they are no longer in history"""
+        if last_version is None or last_version > self.version:
+            return None
+        if last_version == self.version:
+            return []
+        if not self._history or self._history[0][0] > last_version + 1:
+            return None
+        return [
+            event
+            for version, events in self._history if version > last_version
+            for event_name, event in events
+            if include_users or event_name != "users"
+        ]
+
+    def _publish(self, changed):
+        for queue, wants_users in self._subscribers.items():
+            events = [event for event_name, event in changed if wants_users or event_name != "users"]
+            if queue.qsize() + len(events) > queue.maxsize:
+                # Too far behind to patch: replace the backlog with a full snapshot
+                while not queue.empty():
+                    queue.get_nowait()
+                events = self._snapshot_events(wants_users)
+            for event in events:
+                queue.put_nowait(event)
+
+    async def _run(self):
+        try:
+            while self._subscribers:
+                await asyncio.sleep(self.interval)
+                changed = await self._poll()
+                if changed:
+                    self._publish(changed)
+        finally:
+            if self._task is asyncio.current_task():
+                self._task = None
+            await self._close_connection()
+
+    async def close(self):
+        """Stop the poll loop, then close the connection it reads through"""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self._close_connection()
+
+    async def _close_connection(self):
+        """Close the dedicated connection; the next poll reopens it and re-reads everything"""
+        async with self._poll_lock:
+            if self._conn is not None:
+                await self._conn.close()
+                self._conn = None
+                self._data_version = None
+
+    async def subscribe(self, include_users, last_event_id=None):
+        """Register a subscriber and queue what it needs to catch up.
+
+        A client resuming from a version still in history gets only the
+        missed deltas; everyone else starts with full snapshots.
+        """
+        if self._devices is None or self._task is None:
+            await self._poll()
+
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        events = self._missed_events(parse_event_id(last_event_id), include_users)
+        if events is None or len(events) > queue.maxsize:
+            events = self._snapshot_events(include_users)
+        for event in events:
+            queue.put_nowait(event)
+        self._subscribers[queue] = include_users
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return queue
+
+    def mark_changed(self):
+        """Note that this process changed devices or users (safe to call from any thread)"""
+        self._stale = True
+
+    async def snapshot(self):
+        """Bring the snapshots up to date and return the feed.
+
+        Without a local write (mark_changed) since the last check, the
+        snapshot is returned without touching the database for up to one
+        poll interval, so bursts of list requests cost nothing; changes by
+        other processes show up within that interval. Otherwise it costs one
+        PRAGMA read, plus re-reading the lists if the database changed.
+        Changes found here are published to subscribers just as if the loop
+        had found them.
+        """
+        if not self._stale and self._devices is not None and time.monotonic() - self._checked_at < self.interval:
+            return self
+        self._stale = False
+        changed = await self._poll()
+        if changed:
+            self._publish(changed)
+        return self
+
+    def unsubscribe(self, queue):
+        """Remove a subscriber; the loop stops once nobody is listening"""
+        self._subscribers.pop(queue, None)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+
+# Shared feed used by the admin SSE endpoint
+change_feed = ChangeFeed()
@@ -0,0 +1,46 @@
+import asyncio
+
+
+class DeviceChannel:
+    """A connected device WebSocket; sends are serialized so acks and pushes don't interleave"""
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, message):
+        async with self._send_lock:
+            await self.websocket.send_json(message)
+
+
+class DeviceChannelRegistry:
+    """Tracks open device WebSockets by MAC address so the server can push to them"""
+
+    def __init__(self):
+        self._channels = {}  # mac_address -> set of DeviceChannel
+
+    def add(self, mac_address, channel):
+        self._channels.setdefault(mac_address, set()).add(channel)
+
+    def remove(self, mac_address, channel):
+        channels = self._channels.get(mac_address)
+        if channels:
+            channels.discard(channel)
+            if not channels:
+                del self._channels[mac_address]
+
+    async def push(self, mac_address, message):
+        """Send a message to every channel of a device; failed channels are dropped"""
+        for channel in list(self._channels.get(mac_address, ())):
+            try:
+                await channel.send(message)
+            except Exception:
+                self.remove(mac_address, channel)
+
+    @property
+    def connection_count(self):
+        return sum(len(channels) for channels in self._channels.values())
+
+
+# Shared registry of device WebSocket connections
+device_channels = DeviceChannelRegistry()
@@ -0,0 +1,145 @@
+import hashlib
+import hmac
+import re
+import threading
+import time
+from collections import deque
+from os import getenv
+
+from sqlalchemy import delete
+from sqlalchemy.dialects.sqlite import insert
+
+from app.models.database import DeviceNonce, async_engine
+from app.utils.workers import WORKERS
+
+# Shared secret flashed into the firmware; signed identity is disabled while it is empty
+DEVICE_SECRET = getenv("WSMD_DEVICE_SECRET", "")
+# Reject signatures whose timestamp is further than this many seconds from the server clock
+DEVICE_IDENTITY_MAX_SKEW = int(getenv("WSMD_DEVICE_IDENTITY_MAX_SKEW", "300"))
+# Set to 1 to refuse unsigned device requests instead of falling back to ARP
+DEVICE_IDENTITY_REQUIRED = getenv("WSMD_DEVICE_IDENTITY_REQUIRED", "0") == "1"
+
+MAC_HEADER = "X-WSMD-MAC"
+TIMESTAMP_HEADER = "X-WSMD-Timestamp"
+NONCE_HEADER = "X-WSMD-Nonce"
+SIGNATURE_HEADER = "X-WSMD-Signature"
+SERVER_TIME_HEADER = "X-WSMD-Server-Time"
+# Hex HMAC-SHA256; anything else is rejected before comparing
+SIGNATURE_PATTERN = re.compile(r"[0-9a-fA-F]{64}")
+# Longer nonces are rejected so they can't bloat the shared nonce table
+MAX_NONCE_LENGTH = 64
+
+
+class DeviceIdentityError(Exception):
+    """A device request carried a missing, invalid, stale or replayed signature"""
+
+    def __init__(self, detail):
+        super().__init__(detail)
+        self.detail = detail
+
+
+def normalize_mac(mac_address):
+    """Lowercase colon-separated form, or None if it is not a MAC address"""
+    parts = mac_address.replace("-", ":").lower().split(":")
+    if len(parts) != 6 or any(len(part) != 2 for part in parts):
+        return None
+    try:
+        bytes(int(part, 16) for part in parts)
+    except ValueError:
+        return None
+    return ":".join(parts)
+
+
+def sign_identity(secret, path, mac_address, timestamp, nonce):
+    """Hex HMAC-SHA256 over "<path>\\n<mac>\\n<timestamp>\\n<nonce>" (what the firmware computes)"""
+    message = f"{path}\n{mac_address}\n{timestamp}\n{nonce}".encode()
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+class NonceCache:
+    """Remembers (MAC, nonce) pairs for the skew window so a signed request can't be replayed"""
+
+    def __init__(self, ttl=DEVICE_IDENTITY_MAX_SKEW):
+        self.ttl = ttl
+        self._seen = set()
+        self._expiry = deque()  # (expires_at, key) in insertion order
+        self._lock = threading.Lock()
+
+    def add(self, key, now=None):
+        """Record key; returns False if it was already seen within the window"""
+        now = time.time() if now is None else now
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                self._seen.discard(self._expiry.popleft()[1])
+            if key in self._seen:
+                return False
+            self._seen.add(key)
+            self._expiry.append((now + self.ttl * 2, key))
+            return True
+
+    async def add_async(self, key, now=None):
+        return self.add(key, now)
+
+
+class SharedNonceCache:
+    """NonceCache for several worker processes, kept in the device_nonces table.
+
+    A replay sent to a different worker than the original hits the table's
+    primary key. Each check is one short write transaction that also drops
+    expired nonces.
+    """
+
+    def __init__(self, ttl=DEVICE_IDENTITY_MAX_SKEW):
+        self.ttl = ttl
+
+    async def add_async(self, key, now=None):
+        """Record key; returns False if any worker saw it within the window"""
+        now = time.time() if now is None else now
+        mac_address, nonce = key
+        async with async_engine.begin() as conn:
+            await conn.execute(delete(DeviceNonce).where(DeviceNonce.expires_at <= now))
+            result = await conn.execute(
+                insert(DeviceNonce)
+                .values(mac_address=mac_address, nonce=nonce, expires_at=int(now + self.ttl * 2))
+                .on_conflict_do_nothing()
+            )
+        return result.rowcount == 1
+
+
+# Nonces must be shared when another worker could receive the replay
+nonce_cache = SharedNonceCache() if WORKERS > 1 else NonceCache()
+
+
+async def verify_signed_identity(request, secret=DEVICE_SECRET):
+    """Return the MAC address a request proves with its identity headers.
+
+    Returns None when the request carries no identity headers (or signed
+    identity is disabled), so the caller can fall back to ARP. Raises
+    DeviceIdentityError when the headers are present but don't verify.
+    """
+    if not secret:
+        return None
+    headers = request.headers
+    claimed_mac = headers.get(MAC_HEADER)
+    if claimed_mac is None:
+        return None
+
+    timestamp = headers.get(TIMESTAMP_HEADER, "")
+    nonce = headers.get(NONCE_HEADER, "")
+    signature = headers.get(SIGNATURE_HEADER, "")
+    mac_address = normalize_mac(claimed_mac)
+    if (mac_address is None or not (timestamp.isascii() and timestamp.isdigit()) or not nonce
+            or len(nonce) > MAX_NONCE_LENGTH or not SIGNATURE_PATTERN.fullmatch(signature)):
+        raise DeviceIdentityError("Malformed device identity headers")
+
+    # Check the signature over what the device sent before trusting its timestamp or nonce
+    expected = sign_identity(secret, request.url.path, claimed_mac, timestamp, nonce)
+    if not hmac.compare_digest(expected, signature.lower()):
+        raise DeviceIdentityError("Invalid device signature")
+
+    now = time.time()
+    if abs(now - int(timestamp)) > DEVICE_IDENTITY_MAX_SKEW:
+        raise DeviceIdentityError("Device clock out of range")
+    if not await nonce_cache.add_async((mac_address, nonce), now):
+        raise DeviceIdentityError("Replayed device signature")
+    return mac_address
@@ -0,0 +1,153 @@
+import threading
+from os import getenv
+from typing import NamedTuple, Optional
+
+from sqlalchemy import select
+from starlette.concurrency import run_in_threadpool
+
+from app.models.database import Device, SessionLocal
+from app.utils.background import PeriodicWorker
+from app.utils.workers import WORKERS
+
+# Seconds between comparisons of the in-memory registry with the devices table
+DEVICE_REGISTRY_CHECK_INTERVAL = float(getenv("WSMD_DEVICE_REGISTRY_CHECK_INTERVAL", "60"))
+
+
+class DeviceEntry(NamedTuple):
+    """What the hit path needs to know about a registered device"""
+    id: int
+    order: int
+    max_hits: int
+    name: Optional[str]
+
+
+def read_devices(db):
+    """Read every device from the database as {mac_address: DeviceEntry}"""
+    rows = db.execute(select(Device.mac_address, Device.id, Device.order, Device.max_hits, Device.name))
+    return {mac_address: DeviceEntry(id, order, max_hits, name) for mac_address, id, order, max_hits, name in rows}
+
+
+def device_notice(device):
+    """Change notice payload telling other workers about a created or updated device"""
+    return {
+        "mac_address": device.mac_address,
+        "id": device.id,
+        "order": device.order,
+        "max_hits": device.max_hits,
+        "name": device.name,
+    }
+
+
+def entry_from_notice(payload):
+    return DeviceEntry(payload["id"], payload["order"], payload["max_hits"], payload["name"])
+
+
+class DeviceRegistry:
+    """Process-local map of registered devices so hits never look devices up in SQLite.
+
+    Loaded from the database on startup (or on first use) and kept current
+    by the endpoints that create or change devices. check() periodically
+    compares it with the devices table and reloads it if they disagree, e.g.
+    after a manual database edit.
+    """
+
+    def __init__(self, check_interval=DEVICE_REGISTRY_CHECK_INTERVAL, shared=WORKERS > 1):
+        self.shared = shared  # Other processes may register devices we haven't been told about yet
+        self._devices = {}  # mac_address -> DeviceEntry
+        self._version = 0  # Bumped by every put() so check() can tell if it raced with one
+        self._lock = threading.Lock()
+        self.loaded = False
+        # Nothing to reconcile once the server is shutting down
+        self._worker = PeriodicWorker("device-registry-check", check_interval, self.check, final_run=False)
+
+    def get(self, mac_address):
+        """Return the DeviceEntry for a MAC address, or None if it is not registered"""
+        return self._devices.get(mac_address)
+
+    def put(self, device):
+        """Add or update a device from its ORM object"""
+        self.put_entry(device.mac_address, DeviceEntry(device.id, device.order, device.max_hits, device.name))
+
+    def put_entry(self, mac_address, entry):
+        """Add or update a device, e.g. from a change notice sent by another worker"""
+        with self._lock:
+            self._devices[mac_address] = entry
+            self._version += 1
+
+    async def lookup(self, db, mac_address):
+        """Return the DeviceEntry for a MAC address, asking the database on a miss in multi-worker mode.
+
+        A device registered by another worker reaches this registry with the
+        next change notice; until then a hit for it would otherwise be refused.
+        """
+        entry = self._devices.get(mac_address)
+        if entry is not None or not self.shared:
+            return entry
+        row = (await db.execute(
+            select(Device.id, Device.order, Device.max_hits, Device.name).where(Device.mac_address == mac_address)
+        )).first()
+        if row is None:
+            return None
+        entry = DeviceEntry(*row)
+        self.put_entry(mac_address, entry)
+        return entry
+
+    def load(self):
+        """Replace the registry with the current contents of the devices table"""
+        db = SessionLocal()
+        try:
+            devices = read_devices(db)
+        finally:
+            db.close()
+        with self._lock:
+            self._devices = devices
+            self._version += 1
+            self.loaded = True
+        print(f"Device registry loaded with {len(devices)} devices")
+
+    async def ensure_loaded(self):
+        """Load the registry on first use if startup did not"""
+        if not self.loaded:
+            await run_in_threadpool(self.load)
+
+    def check(self):
+        """Compare the registry with the database and reload it if they differ.
+
+        Returns the MAC addresses whose entries were missing, stale or extra.
+        """
+        if not self.loaded:
+            return []
+        version = self._version
+        db = SessionLocal()
+        try:
+            devices = read_devices(db)
+        finally:
+            db.close()
+
+        mismatched = sorted(
+            mac_address for mac_address in devices.keys() | self._devices.keys()
+            if devices.get(mac_address) != self._devices.get(mac_address)
+        )
+        if mismatched:
+            with self._lock:
+                # A concurrent put() may be newer than what we read; the next check will see it
+                if self._version == version:
+                    self._devices = devices
+                    self._version += 1
+                    print(f"Device registry was out of sync for {len(mismatched)} devices; reloaded")
+        return mismatched
+
+    def start(self):
+        """Load the registry and start the periodic consistency check"""
+        self.load()
+        self._worker.start()
+
+    def stop(self):
+        self._worker.stop()
+
+    def __len__(self):
+        return len(self._devices)
+
+
+# Shared registry of known devices
+device_registry = DeviceRegistry()
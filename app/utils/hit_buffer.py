@@ -0,0 +1,178 @@
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from os import getenv
+
+import anyio.to_thread
+from sqlalchemy import text
+
+from app.models.database import SessionLocal
+from app.utils.background import PeriodicWorker
+from app.utils.change_feed import change_feed
+from app.utils.workers import WORKERS
+
+# Write-behind configuration (opt-in)
+WRITE_BEHIND_ENABLED = getenv("WSMD_WRITE_BEHIND", "0") == "1"
+FLUSH_INTERVAL_MS = int(getenv("WSMD_FLUSH_INTERVAL_MS", "500"))
+FLUSH_MAX_HITS = int(getenv("WSMD_FLUSH_MAX_HITS", "100"))
+
+# Each worker would cache and write back its own absolute counters, overwriting the others'
+if WRITE_BEHIND_ENABLED and WORKERS > 1:
+    print("WSMD_WRITE_BEHIND is not supported with WSMD_WORKERS > 1; writing hits directly")
+    WRITE_BEHIND_ENABLED = False
+
+
+def apply_rollover(counter, count, max_hits):
+    """Add count hits to counter the way the reset_hit_counter trigger would.
+
+    The trigger resets the counter to 0 whenever an update leaves it at or
+    above max_hits, so adding hits one at a time is a walk modulo max_hits.
+    """
+    if max_hits <= 0:
+        return 0
+    return (counter + count) % max_hits
+
+
+class HitBuffer:
+    """In-memory per-device hit counters flushed to SQLite in batches.
+
+    Hits are applied to a cached copy of each device's counter and answered
+    from memory. Dirty counters are written back in a single transaction
+    every ``interval_ms`` milliseconds or once ``max_pending`` hits have
+    accumulated, and once more when the buffer is stopped.
+    """
+
+    def __init__(self, session_factory, interval_ms=FLUSH_INTERVAL_MS, max_pending=FLUSH_MAX_HITS):
+        self.session_factory = session_factory
+        self.interval = interval_ms / 1000
+        self.max_pending = max_pending
+        self._devices = {}  # mac_address -> cached device state
+        self._pending = 0
+        self._lock = threading.RLock()
+        self._flush_lock = threading.RLock()
+        # Bumped whenever cached entries are dropped, so a load that raced with it is not cached
+        self.generation = 0
+        self._paused = {}  # mac_address -> asyncio.Event set when its edit finishes
+        self._pause_lock = asyncio.Lock()
+        self._worker = PeriodicWorker("hit-buffer-flush", self.interval, self.flush)
+
+    def add(self, mac_address, device_id, counter, max_hits, order, generation):
+        """Cache a device loaded from the database unless it is already cached.
+
+        generation is the value of ``self.generation`` read before the
+        device was loaded; if entries were dropped since, the row may predate
+        an edit, so nothing is cached and False is returned.
+        """
+        with self._lock:
+            if generation != self.generation:
+                return False
+            self._devices.setdefault(mac_address, {
+                "id": device_id,
+                "counter": counter,
+                "max_hits": max_hits,
+                "order": order,
+                "dirty": False,
+            })
+            return True
+
+    def hit(self, mac_address, count=1):
+        """Apply hits to a cached device and return its id and new counter state.
+
+        Returns None if the device is not cached; the caller loads it with
+        ``add()`` and retries.
+        """
+        with self._lock:
+            state = self._devices.get(mac_address)
+            if state is None:
+                return None
+
+            state["counter"] = apply_rollover(state["counter"], count, state["max_hits"])
+            state["dirty"] = True
+            self._pending += count
+            result = {
+                "id": state["id"],
+                "counter": state["counter"],
+                "max_hits": state["max_hits"],
+                "order": state["order"],
+            }
+            flush_now = self._pending >= self.max_pending
+
+        if flush_now:
+            self._worker.wake()
+        return result
+
+    def flush(self):
+        """Write all dirty counters to the database in one transaction"""
+        with self._flush_lock:
+            with self._lock:
+                batch = [
+                    (mac, state["id"], state["counter"])
+                    for mac, state in self._devices.items()
+                    if state["dirty"]
+                ]
+                for mac, _, _ in batch:
+                    self._devices[mac]["dirty"] = False
+                self._pending = 0
+
+            if not batch:
+                return 0
+
+            db = self.session_factory()
+            try:
+                db.execute(
+                    text("UPDATE devices SET hit_counter = :counter WHERE id = :id"),
+                    [{"id": device_id, "counter": counter} for _, device_id, counter in batch],
+                )
+                db.commit()
+                change_feed.mark_changed()
+            except Exception:
+                db.rollback()
+                # Mark the batch dirty again so the next flush retries it
+                with self._lock:
+                    for mac, _, _ in batch:
+                        if mac in self._devices:
+                            self._devices[mac]["dirty"] = True
+                raise
+            finally:
+                db.close()
+            return len(batch)
+
+    async def wait_resumed(self, mac_address):
+        """Wait (without blocking the event loop) while the device is being edited"""
+        while mac_address in self._paused:
+            await self._paused[mac_address].wait()
+
+    @asynccontextmanager
+    async def paused(self, mac_address):
+        """Flush and hold off hits for a device while the caller changes it directly.
+
+        Hits for the device wait in ``wait_resumed()``; the event loop and
+        other devices carry on, and no lock is held across database I/O. The
+        device's cached entry is dropped on exit so the next hit reloads it
+        with whatever max_hits/order the caller wrote.
+        """
+        async with self._pause_lock:
+            resumed = self._paused[mac_address] = asyncio.Event()
+            try:
+                with self._lock:
+                    self.generation += 1
+                await anyio.to_thread.run_sync(self.flush)
+                yield
+            finally:
+                with self._lock:
+                    self._devices.pop(mac_address, None)
+                    self.generation += 1
+                del self._paused[mac_address]
+                resumed.set()
+
+    def start(self):
+        """Start the background flush thread"""
+        self._worker.start()
+
+    def stop(self):
+        """Stop the flush thread and write out anything still pending"""
+        self._worker.stop()
+
+
+# Shared buffer used by the device endpoints when write-behind is enabled
+hit_buffer = HitBuffer(SessionLocal)
@@ -0,0 +1,154 @@
+import math
+import threading
+import time
+from collections import Counter
+from os import getenv
+
+from sqlalchemy import text
+
+from app.models.database import HitEvent, HitRollupMinute, HitRollupHour, SessionLocal
+from app.utils.background import PeriodicWorker
+
+# Hit event log configuration
+HIT_LOG_ENABLED = getenv("WSMD_HIT_LOG", "1") == "1"
+HIT_LOG_FLUSH_INTERVAL_MS = int(getenv("WSMD_HIT_LOG_FLUSH_INTERVAL_MS", "1000"))
+HIT_LOG_BATCH_SIZE = int(getenv("WSMD_HIT_LOG_BATCH_SIZE", "500"))
+# Raw events are pruned after this many hours; hourly rollups are kept forever
+HIT_EVENT_RETENTION_HOURS = int(getenv("WSMD_HIT_EVENT_RETENTION_HOURS", "24"))
+HIT_MINUTE_ROLLUP_RETENTION_DAYS = int(getenv("WSMD_HIT_MINUTE_ROLLUP_RETENTION_DAYS", "7"))
+PRUNE_INTERVAL = 300  # Seconds between retention passes
+# A batch that fails this many writes in a row is dropped instead of retried again
+HIT_LOG_MAX_WRITE_ATTEMPTS = int(getenv("WSMD_HIT_LOG_MAX_WRITE_ATTEMPTS", "3"))
+# Hit times further than this in the future are recorded at the current time
+HIT_TIME_MAX_SKEW = 300
+
+ROLLUP_TABLES = {
+    "minute": (HitRollupMinute, 60),
+    "hour": (HitRollupHour, 3600),
+}
+
+
+def _upsert_rollup_sql(table_name):
+    return text(
+        f"INSERT INTO {table_name} (device_id, bucket, hits) VALUES (:device_id, :bucket, :hits) "
+        f"ON CONFLICT (device_id, bucket) DO UPDATE SET hits = hits + excluded.hits"
+    )
+
+
+class HitLog:
+    """Append-only hit event log with incrementally maintained rollups.
+
+    Hits are queued in memory and bulk-inserted into ``hit_events`` in
+    batches. Each batch is also aggregated into per-minute and per-hour
+    buckets and upserted into the rollup tables in the same transaction,
+    so history queries only ever read the rollups.
+    """
+
+    def __init__(self, session_factory, interval_ms=HIT_LOG_FLUSH_INTERVAL_MS, batch_size=HIT_LOG_BATCH_SIZE):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self._events = []  # (device_id, timestamp) pairs waiting to be written
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_prune = 0.0
+        self._failed_writes = 0  # Consecutive failed writes of the queued batch
+        self._worker = PeriodicWorker("hit-log-flush", interval_ms / 1000, self.flush)
+
+    def record(self, device_id, count=1, timestamp=None):
+        """Queue count hits for a device at timestamp (Unix seconds, default now).
+
+        Timestamps that are not finite, negative or too far in the future
+        are replaced by the current time, so every queued event can be stored.
+        """
+        now = time.time()
+        if timestamp is None or not math.isfinite(timestamp) or not 0 <= timestamp <= now + HIT_TIME_MAX_SKEW:
+            timestamp = now
+        ts = int(timestamp)
+        with self._lock:
+            self._events.extend([(device_id, ts)] * count)
+            flush_now = len(self._events) >= self.batch_size
+        if flush_now:
+            self._worker.wake()
+
+    def flush(self):
+        """Write queued events and their rollup increments in one transaction"""
+        with self._flush_lock:
+            with self._lock:
+                events, self._events = self._events, []
+
+            if events:
+                self._write(events)
+
+            if time.monotonic() - self._last_prune > PRUNE_INTERVAL:
+                self.prune()
+            return len(events)
+
+    def _write(self, events):
+        db = self.session_factory()
+        try:
+            db.execute(
+                HitEvent.__table__.insert(),
+                [{"device_id": device_id, "timestamp": ts} for device_id, ts in events],
+            )
+            for model, width in ROLLUP_TABLES.values():
+                buckets = Counter((device_id, ts - ts % width) for device_id, ts in events)
+                db.execute(
+                    _upsert_rollup_sql(model.__tablename__),
+                    [
+                        {"device_id": device_id, "bucket": bucket, "hits": hits}
+                        for (device_id, bucket), hits in buckets.items()
+                    ],
+                )
+            db.commit()
+            self._failed_writes = 0
+        except Exception:
+            db.rollback()
+            self._failed_writes += 1
+            if self._failed_writes >= HIT_LOG_MAX_WRITE_ATTEMPTS:
+                # Give up rather than block all later hits behind this batch
+                print(f"Dropping {len(events)} hit events after {self._failed_writes} failed writes")
+                self._failed_writes = 0
+            else:
+                # Put the batch back in front of anything queued since
+                with self._lock:
+                    self._events[:0] = events
+            raise
+        finally:
+            db.close()
+
+    def prune(self, now=None):
+        """Delete raw events and minute rollups past their retention window"""
+        now = int(time.time() if now is None else now)
+        self._last_prune = time.monotonic()
+        db = self.session_factory()
+        try:
+            db.query(HitEvent).filter(
+                HitEvent.timestamp < now - HIT_EVENT_RETENTION_HOURS * 3600
+            ).delete(synchronize_session=False)
+            db.query(HitRollupMinute).filter(
+                HitRollupMinute.bucket < now - HIT_MINUTE_ROLLUP_RETENTION_DAYS * 86400
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def start(self):
+        """Start the background flush thread"""
+        self._worker.start()
+
+    def stop(self):
+        """Stop the flush thread and write out anything still queued"""
+        self._worker.stop()
+
+
+def get_hit_history(db, device_id, resolution="hour", since=None):
+    """Return [{"timestamp", "hits"}] buckets for a device from the rollup tables"""
+    model, _ = ROLLUP_TABLES[resolution]
+    query = db.query(model.bucket, model.hits).filter(model.device_id == device_id)
+    if since is not None:
+        query = query.filter(model.bucket >= since)
+    return [{"timestamp": bucket, "hits": hits} for bucket, hits in query.order_by(model.bucket)]
+
+
+# Shared hit log used by the device endpoints
+hit_log = HitLog(SessionLocal)
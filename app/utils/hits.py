@@ -0,0 +1,132 @@
+import asyncio
+import sqlite3
+
+from sqlalchemy import Integer, bindparam, select, update, case
+
+from app.models.database import Device, default_device_name
+from app.utils.change_feed import change_feed
+from app.utils.device_registry import device_registry
+from app.utils.hit_buffer import WRITE_BEHIND_ENABLED, hit_buffer
+from app.utils.hit_log import HIT_LOG_ENABLED, hit_log
+from app.utils.metrics import record_hits
+
+
+async def get_device_by_mac(db, mac_address):
+    """Load a registered device, naming it if needed; None if it is unknown"""
+    result = await db.execute(select(Device).where(Device.mac_address == mac_address))
+    device = result.scalars().first()
+
+    # If device doesn't have a name, generate one
+    if device and not device.name:
+        device.name = default_device_name(mac_address, device.order)
+        await db.commit()
+
+    return device
+
+
+def rollover_expression(count):
+    """SQL for hit_counter after count hits, matching apply_rollover()"""
+    return case((Device.max_hits > 0, (Device.hit_counter + count) % Device.max_hits), else_=0)
+
+
+# UPDATE ... RETURNING needs SQLite 3.35 (Raspberry Pi OS Bullseye ships 3.34)
+SQLITE_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Built once with bind parameters, so SQLAlchemy's compiled cache and sqlite3's
+# per-connection statement cache are hit on every request. The new value is
+# always below max_hits, so the reset_hit_counter trigger never fires for hits.
+devices_table = Device.__table__
+HIT_UPDATE = (
+    update(devices_table)
+    .where(devices_table.c.id == bindparam("device_id"))
+    .values(hit_counter=rollover_expression(bindparam("count", type_=Integer)))
+)
+HIT_UPDATE_RETURNING = HIT_UPDATE.returning(
+    devices_table.c.hit_counter, devices_table.c.max_hits, devices_table.c.order
+)
+HIT_STATE = select(devices_table.c.hit_counter, devices_table.c.max_hits, devices_table.c.order).where(
+    devices_table.c.id == bindparam("device_id")
+)
+
+# Hit transactions from this process take turns here instead of in SQLite's busy
+# handler, whose sleeps grow to 100 ms and caused long latency tails under load
+hit_write_lock = asyncio.Lock()
+
+
+async def write_hits(db, device_id, count):
+    """Apply count hits in SQL and commit; returns (hit_counter, max_hits, order) or None"""
+    params = {"device_id": device_id, "count": count}
+    async with hit_write_lock:
+        conn = await db.connection()
+        if SQLITE_HAS_RETURNING:
+            row = (await conn.execute(HIT_UPDATE_RETURNING, params)).first()
+        else:
+            await conn.execute(HIT_UPDATE, params)
+            row = (await conn.execute(HIT_STATE, params)).first()
+        await db.commit()
+    change_feed.mark_changed()
+    return row
+
+
+async def apply_hits(db, mac_address, count=1, timestamps=None):
+    """Apply count hits to a device with the reset_hit_counter rollover semantics.
+    
+    The device is looked up in the in-memory registry, so unknown MACs are
+    rejected without touching SQLite (with several workers, a miss is
+    checked against the database in case another worker just registered
+    it). All hits are applied in one UPDATE ... RETURNING (or one in-memory
+    update when write-behind is enabled) and logged with their timestamps
+    (Unix seconds; hits without one are logged at the current time).
+    
+    Returns the response payload {"counter", "max_hits", "order"}, or None
+    if the device is not registered.
+    """
+    await device_registry.ensure_loaded()
+    entry = await device_registry.lookup(db, mac_address)
+    if entry is None:
+        return None
+    
+    if WRITE_BEHIND_ENABLED:
+        while True:
+            # No await between this check and hit(), so an edit cannot start in between
+            await hit_buffer.wait_resumed(mac_address)
+            state = hit_buffer.hit(mac_address, count)
+            if state is not None:
+                break
+            # Not cached yet: read the counter once, then apply the hits in memory.
+            # If an edit dropped cached entries meanwhile, the row may be stale; read it again.
+            generation = hit_buffer.generation
+            row = (await db.execute(
+                select(Device.hit_counter, Device.max_hits, Device.order).where(Device.id == entry.id)
+            )).first()
+            if row is None:
+                return None
+            if not hit_buffer.add(mac_address, entry.id, row.hit_counter, row.max_hits, row.order, generation):
+                # End the read transaction so the next SELECT sees the edit
+                await db.rollback()
+        result = {
+            "counter": state["counter"],
+            "max_hits": state["max_hits"],
+            "order": state["order"]
+        }
+    else:
+        row = await write_hits(db, entry.id, count)
+        if row is None:
+            return None
+        
+        result = {
+            "counter": row.hit_counter,
+            "max_hits": row.max_hits,
+            "order": row.order
+        }
+    
+    device_id = entry.id
+    record_hits(mac_address, count, result["counter"], result["max_hits"])
+    if HIT_LOG_ENABLED:
+        timestamps = list(timestamps or [])
+        for timestamp in timestamps[:count]:
+            hit_log.record(device_id, timestamp=timestamp)
+        if count > len(timestamps):
+            hit_log.record(device_id, count - len(timestamps))
+
+    return result
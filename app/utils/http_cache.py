@@ -0,0 +1,15 @@
+import hashlib
+
+
+def etag_for(payload):
+    """Strong ETag for a response body (bytes), the same in every worker process"""
+    return '"' + hashlib.blake2b(payload, digest_size=12).hexdigest() + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header value matches etag (weak comparison, as RFC 9110 asks)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in if_none_match.split(","))
@@ -0,0 +1,31 @@
+import importlib
+import json
+from os import getenv
+
+# Encoder for device/user snapshots and SSE events: "auto" (orjson if installed),
+# "orjson", "json" (standard library) or "module:function" returning bytes
+JSON_ENCODER = getenv("WSMD_JSON_ENCODER", "auto")
+
+
+def encode_stdlib(obj):
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+def load_encoder(name=JSON_ENCODER):
+    """Return a function that serializes an object to JSON bytes"""
+    if name in ("auto", "orjson"):
+        try:
+            import orjson
+        except ImportError:
+            if name == "orjson":
+                raise
+        else:
+            return orjson.dumps
+    if name in ("auto", "json"):
+        return encode_stdlib
+    module_name, _, function_name = name.partition(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+# Shared encoder
+encode_json = load_encoder()
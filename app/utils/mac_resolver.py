@@ -0,0 +1,141 @@
+import threading
+import time
+from os import getenv
+
+from app.utils.network import resolve_mac_from_ip
+
+# Constants
+PROC_ARP_PATH = '/proc/net/arp'
+DNSMASQ_LEASES_PATH = '/var/lib/misc/dnsmasq.leases'
+EMPTY_MAC = '00:00:00:00:00:00'
+ATF_COM = 0x2  # Kernel ARP flag for a completed entry
+
+# How long a loaded table is trusted before it is re-read
+MAC_TABLE_TTL = float(getenv("WSMD_MAC_TABLE_TTL", "30"))
+# Minimum gap between table re-reads triggered by a lookup miss
+MAC_MISS_REFRESH_INTERVAL = float(getenv("WSMD_MAC_MISS_REFRESH_INTERVAL", "1"))
+# How long an IP that no source (not even ``arp``) could resolve is answered as unknown without retrying
+MAC_NEGATIVE_TTL = float(getenv("WSMD_MAC_NEGATIVE_TTL", "30"))
+
+
+def read_proc_arp(path=PROC_ARP_PATH):
+    """Parse the kernel ARP table into an IP -> MAC mapping"""
+    table = {}
+    try:
+        with open(path, 'r') as f:
+            next(f, None)  # Skip the header line
+            for line in f:
+                fields = line.split()
+                if len(fields) < 4:
+                    continue
+                ip, flags, mac = fields[0], fields[2], fields[3]
+                try:
+                    if not int(flags, 16) & ATF_COM:
+                        continue
+                except ValueError:
+                    continue
+                if mac == EMPTY_MAC:
+                    continue
+                table[ip] = mac.lower()
+    except OSError:
+        pass
+    return table
+
+
+def read_dnsmasq_leases(path=DNSMASQ_LEASES_PATH):
+    """Parse the dnsmasq lease file (AP mode) into an IP -> MAC mapping"""
+    table = {}
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                # Format: <expiry> <mac> <ip> <hostname> <client-id>
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                table[fields[2]] = fields[1].lower()
+    except OSError:
+        pass
+    return table
+
+
+class MacResolver:
+    """In-memory IP -> MAC table built from /proc/net/arp and dnsmasq leases.
+
+    The table is reloaded when it is older than ``ttl`` seconds or when a
+    lookup misses (rate limited by ``miss_refresh_interval``). The ``arp``
+    subprocess is only used when both sources miss, and at most once per
+    ``negative_ttl`` seconds for an IP it could not resolve either.
+    """
+
+    def __init__(self, ttl=MAC_TABLE_TTL, miss_refresh_interval=MAC_MISS_REFRESH_INTERVAL,
+                 arp_path=PROC_ARP_PATH, leases_path=DNSMASQ_LEASES_PATH, fallback=resolve_mac_from_ip,
+                 negative_ttl=MAC_NEGATIVE_TTL):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.miss_refresh_interval = miss_refresh_interval
+        self.arp_path = arp_path
+        self.leases_path = leases_path
+        self.fallback = fallback
+        self._table = {}
+        self._misses = {}  # ip -> monotonic time ``arp`` last failed to resolve it
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Reload the table from the kernel ARP cache and the dnsmasq leases"""
+        # Leases first so the live ARP cache wins if the two disagree
+        table = read_dnsmasq_leases(self.leases_path)
+        table.update(read_proc_arp(self.arp_path))
+        with self._lock:
+            self._table = table
+            self._loaded_at = time.monotonic()
+
+    def lookup(self, ip_address):
+        """Look an IP up in the table, re-reading it on TTL expiry or a miss; never forks"""
+        if time.monotonic() - self._loaded_at > self.ttl:
+            self.refresh()
+
+        mac = self._table.get(ip_address)
+        if mac:
+            return mac
+
+        # Miss: re-read the sources unless we just did
+        if time.monotonic() - self._loaded_at > self.miss_refresh_interval:
+            self.refresh()
+            return self._table.get(ip_address)
+        return None
+
+    def is_known_miss(self, ip_address):
+        """Whether ``arp`` failed to resolve this IP within the last negative_ttl seconds"""
+        missed_at = self._misses.get(ip_address)
+        return missed_at is not None and time.monotonic() - missed_at < self.negative_ttl
+
+    def resolve(self, ip_address):
+        """Resolve a MAC address for an IP, falling back to ``arp`` as a last resort"""
+        mac = self.lookup(ip_address)
+        if mac:
+            return mac
+        if self.is_known_miss(ip_address):
+            return None
+
+        mac = self.fallback(ip_address)
+        with self._lock:
+            if mac:
+                self._table[ip_address] = mac
+                self._misses.pop(ip_address, None)
+            else:
+                # Drop expired misses so unknown clients can't grow this without bound
+                now = time.monotonic()
+                self._misses = {ip: t for ip, t in self._misses.items() if now - t < self.negative_ttl}
+                self._misses[ip_address] = now
+        return mac
+
+    def invalidate(self):
+        """Force the next lookup to reload the table"""
+        with self._lock:
+            self._loaded_at = 0.0
+            self._misses.clear()
+
+
+# Shared resolver used by the request handlers
+mac_resolver = MacResolver()
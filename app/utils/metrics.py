@@ -0,0 +1,267 @@
+# Minimal Prometheus metrics (text exposition format 0.0.4) without extra dependencies.
+#
+# Collection is kept cheap for the hit path: counters and histogram buckets are
+# plain Python numbers in preallocated lists, updated without locks. Nearly all
+# updates happen on the event loop thread; an increment racing with one from a
+# worker thread can in rare cases be lost, which is acceptable for monitoring.
+import hmac
+import time
+from bisect import bisect_left
+from functools import partial
+from os import getenv
+
+from sqlalchemy import event
+
+# Set to 1 to enable the /metrics endpoint and request timing; off by default
+# since the per-device counters expose every registered MAC address
+METRICS_ENABLED = getenv("WSMD_METRICS", "0") == "1"
+# When set, /metrics requires "Authorization: Bearer <token>"
+METRICS_TOKEN = getenv("WSMD_METRICS_TOKEN")
+
+# Upper bounds in seconds, from sub-millisecond DB calls to slow SSE streams
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{escape_label_value(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def metrics_authorized(authorization):
+    """Whether an Authorization header may read /metrics (always, if no token is configured)"""
+    if not METRICS_TOKEN:
+        return True
+    scheme, _, token = (authorization or "").partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(token.strip().encode(), METRICS_TOKEN.encode())
+
+
+class HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Metric:
+    """A metric family; child_factory() creates one child per label combination"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), child_factory=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.child_factory = child_factory
+        self._children = {}
+        if child_factory is not None and not self.labelnames:
+            self._default = self.labels()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children.setdefault(values, self.child_factory())
+        return child
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames, CounterChild)
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def render(self):
+        lines = self.header()
+        for values, child in list(self._children.items()):
+            lines.append(f"{self.name}{format_labels(self.labelnames, values)} {child.value}")
+        return lines
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.bounds = tuple(buckets)
+        super().__init__(name, documentation, labelnames, partial(HistogramChild, self.bounds))
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return Timer(self._default)
+
+    def render(self):
+        lines = self.header()
+        bucket_labels = self.labelnames + ("le",)
+        for values, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.bounds + ("+Inf",), list(child.counts)):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels(bucket_labels, values + (bound,))} {cumulative}")
+            labels = format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {child.sum}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge(Metric):
+    """Gauge whose value is read from a callback at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, func):
+        self.func = func
+        super().__init__(name, documentation)
+
+    def render(self):
+        return self.header() + [f"{self.name} {self.func()}"]
+
+
+class Timer:
+    """Context manager observing the elapsed time into a histogram child"""
+
+    __slots__ = ("child", "start")
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.child.observe(time.perf_counter() - self.start)
+
+
+REGISTRY = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+def render_metrics():
+    """Render every registered metric in the Prometheus text format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+REQUEST_LATENCY = register(Histogram(
+    "wsmd_http_request_duration_seconds", "HTTP request latency by route", ("method", "route")
+))
+MAC_RESOLUTION_LATENCY = register(Histogram(
+    "wsmd_mac_resolution_seconds", "Time to resolve a client IP address to a MAC address"
+))
+DB_LATENCY = register(Histogram(
+    "wsmd_db_seconds", "SQLite statement execution and commit time", ("operation",)
+))
+SSE_SERIALIZATION_LATENCY = register(Histogram(
+    "wsmd_sse_serialization_seconds", "Time to serialize one SSE event"
+))
+HITS = register(Counter("wsmd_hits_total", "Hits applied per device", ("mac_address",)))
+ROLLOVERS = register(Counter(
+    "wsmd_hit_counter_rollovers_total", "Times a device's hit counter reached max_hits and reset", ("mac_address",)
+))
+
+DB_QUERY = DB_LATENCY.labels("query")
+DB_COMMIT = DB_LATENCY.labels("commit")
+
+
+def count_rollovers(counter, count, max_hits):
+    """Number of resets caused by count hits that left the counter at counter"""
+    if max_hits <= 0:
+        return count
+    previous = (counter - count) % max_hits
+    return (previous + count) // max_hits
+
+
+def record_hits(mac_address, count, counter, max_hits):
+    HITS.labels(mac_address).inc(count)
+    rollovers = count_rollovers(counter, count, max_hits)
+    if rollovers:
+        ROLLOVERS.labels(mac_address).inc(rollovers)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    DB_QUERY.observe(time.perf_counter() - conn.info["query_start"].pop())
+
+
+def _handle_error(context):
+    # Failed statements never reach after_cursor_execute
+    if context.connection is not None and context.connection.info.get("query_start"):
+        context.connection.info["query_start"].pop()
+
+
+def instrument_engine(engine):
+    """Time statements and commits of a sync or async SQLAlchemy engine"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+    do_commit = sync_engine.dialect.do_commit
+
+    def timed_commit(dbapi_connection):
+        start = time.perf_counter()
+        do_commit(dbapi_connection)
+        DB_COMMIT.observe(time.perf_counter() - start)
+
+    sync_engine.dialect.do_commit = timed_commit
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency labelled with the route template"""
+
+    def __init__(self, app, routes=()):
+        self.app = app
+        self.route_paths = None
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if self.route_paths is None:
+                self.route_paths = {
+                    route.endpoint: route.path for route in self.routes if hasattr(route, "endpoint")
+                }
+            route = self.route_paths.get(scope.get("endpoint"), "other")
+            REQUEST_LATENCY.labels(scope["method"], route).observe(time.perf_counter() - start)
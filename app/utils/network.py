@@ -76,11 +76,37 @@ def get_client_ip(request):
         return forwarded.split(",")[0]
     return request.client.host
 
-def get_client_mac(request):
-    """Get client MAC address from FastAPI request by resolving IP"""
+async def get_signed_mac(request):
+    """MAC address proven by signed identity headers, or None to fall back to ARP.
+    
+    Raises DeviceIdentityError for a bad signature, or for an unsigned request
+    when WSMD_DEVICE_IDENTITY_REQUIRED is set.
+    """
+    from app.utils.device_identity import (
+        DEVICE_SECRET, DEVICE_IDENTITY_REQUIRED, DeviceIdentityError, verify_signed_identity
+    )
+
+    mac = await verify_signed_identity(request)
+    if mac is None and DEVICE_SECRET and DEVICE_IDENTITY_REQUIRED:
+        raise DeviceIdentityError("Signed device identity required")
+    return mac
+
+async def get_client_mac_async(request):
+    """Get the client's MAC address from signed headers or by resolving its IP.
+    
+    Only the ``arp`` fallback runs in a worker thread, and not at all for an
+    IP it recently failed to resolve.
+    """
+    from starlette.concurrency import run_in_threadpool
+    from app.utils.mac_resolver import mac_resolver
+    from app.utils.metrics import MAC_RESOLUTION_LATENCY
+
     ip = get_client_ip(request)
-    print(f"Client IP: {ip}")
-    return resolve_mac_from_ip(ip)
+    with MAC_RESOLUTION_LATENCY.time():
+        mac = await get_signed_mac(request) or mac_resolver.lookup(ip)
+        if mac or mac_resolver.is_known_miss(ip):
+            return mac
+        return await run_in_threadpool(mac_resolver.resolve, ip)
 
 def generate_strong_password(length=8):
     """Generate a strong random password"""
@@ -184,14 +210,33 @@ IP Address: 10.0.0.1
     
     return password
 
-def next_available_order(db_session):
-    """Find the next available order number from the database"""
-    from app.models.database import Device
+async def insert_device_with_next_order(db_session, mac_address):
+    """Insert a new device with the next free order number and return it.
     
-    # Get the highest order currently in use
-    highest_order = db_session.query(Device).order_by(Device.order.desc()).first()
+    The order is computed inside the INSERT statement itself, so it is
+    allocated under SQLite's write lock and concurrent registrations (from
+    any process) can never receive the same number. MAX("order") is served
+    by the index on devices.order. Returns None if another request inserted
+    the same MAC address first.
+    """
+    from sqlalchemy import select, insert, func, literal
+    from sqlalchemy.exc import IntegrityError
+    from app.models.database import Device, default_device_name
     
-    if highest_order is None or highest_order.order == 0:
-        return 1
+    next_order = select(func.coalesce(func.max(Device.order), 0) + 1).scalar_subquery()
+    try:
+        await db_session.execute(
+            insert(Device).from_select(
+                ["mac_address", "hit_counter", "order"],
+                select(literal(mac_address), literal(0), next_order)
+            )
+        )
+    except IntegrityError:
+        await db_session.rollback()
+        return None
     
-    return highest_order.order + 1
+    # Name the device in the same transaction, now that its order is known
+    device = (await db_session.execute(select(Device).where(Device.mac_address == mac_address))).scalars().one()
+    device.name = default_device_name(mac_address, device.order)
+    await db_session.commit()
+    return device
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import os
+import time
+from os import getenv
+
+from sqlalchemy import select, insert, delete, func
+
+from app.models.database import ChangeNotice, engine, async_engine
+from app.utils.workers import WORKERS
+
+# How often each worker checks for notices from the others
+NOTIFY_POLL_INTERVAL_MS = int(getenv("WSMD_NOTIFY_POLL_INTERVAL_MS", "100"))
+# Notices older than this are deleted by the primary worker
+NOTICE_RETENTION_SECONDS = 60
+
+
+class NotificationBus:
+    """Cross-process change notifications for multi-worker deployments.
+
+    A worker that changes shared state (a device, a user) records a notice in
+    the change_notices table. Every worker watches ``PRAGMA data_version`` on a
+    dedicated connection and, when the database changed, reads the notices it
+    hasn't seen and passes those from other processes to the handlers
+    registered with on(). With a single worker nothing is recorded.
+    """
+
+    def __init__(self, enabled=WORKERS > 1, interval_ms=NOTIFY_POLL_INTERVAL_MS):
+        self.enabled = enabled
+        self.interval = interval_ms / 1000
+        self.prune = False  # Set on the primary worker
+        self._handlers = {}  # topic -> [handler]
+        self._task = None
+        self._last_id = 0
+
+    def on(self, topic, handler):
+        """Call handler(payload) for notices of topic published by other processes"""
+        self._handlers.setdefault(topic, []).append(handler)
+
+    def _notice(self, topic, payload):
+        return insert(ChangeNotice).values(
+            origin=os.getpid(), topic=topic, payload=json.dumps(payload), created_at=int(time.time())
+        )
+
+    def publish(self, topic, payload):
+        """Record a notice from sync code (e.g. a sync endpoint in the threadpool)"""
+        if not self.enabled:
+            return
+        with engine.begin() as conn:
+            conn.execute(self._notice(topic, payload))
+
+    async def publish_async(self, topic, payload):
+        """Record a notice from async code"""
+        if not self.enabled:
+            return
+        async with async_engine.begin() as conn:
+            await conn.execute(self._notice(topic, payload))
+
+    async def _dispatch(self, notice):
+        for handler in self._handlers.get(notice.topic, ()):
+            try:
+                result = handler(json.loads(notice.payload))
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                print(f"Error handling {notice.topic} notice: {e}")
+
+    async def _poll(self, conn, data_version, last_prune):
+        try:
+            version = (await conn.exec_driver_sql("PRAGMA data_version")).scalar()
+            notices = []
+            if version != data_version:
+                data_version = version
+                notices = (await conn.execute(
+                    select(ChangeNotice).where(ChangeNotice.id > self._last_id).order_by(ChangeNotice.id)
+                )).all()
+        finally:
+            # Never hold a read transaction open between polls
+            await conn.rollback()
+
+        for notice in notices:
+            self._last_id = notice.id
+            if notice.origin != os.getpid():
+                await self._dispatch(notice)
+
+        if self.prune and time.time() - last_prune > NOTICE_RETENTION_SECONDS:
+            last_prune = time.time()
+            await conn.execute(
+                delete(ChangeNotice).where(ChangeNotice.created_at < last_prune - NOTICE_RETENTION_SECONDS)
+            )
+            await conn.commit()
+        return data_version, last_prune
+
+    async def _run(self):
+        conn = await async_engine.connect()
+        data_version = None
+        last_prune = 0
+        try:
+            self._last_id = (await conn.execute(select(func.coalesce(func.max(ChangeNotice.id), 0)))).scalar()
+            await conn.rollback()
+            while True:
+                await asyncio.sleep(self.interval)
+                try:
+                    data_version, last_prune = await self._poll(conn, data_version, last_prune)
+                except Exception as e:
+                    print(f"Error polling change notices: {e}")
+        finally:
+            await conn.close()
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Shared notification bus between worker processes
+notification_bus = NotificationBus()
@@ -0,0 +1,74 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from os import getenv
+
+from app.utils.auth import get_pwd_context
+
+# bcrypt work runs on this many threads; further requests wait in a short queue
+PASSWORD_WORKERS = int(getenv("WSMD_PASSWORD_WORKERS", "1"))
+# Password operations allowed to wait for a worker before new ones are refused
+PASSWORD_QUEUE_LIMIT = int(getenv("WSMD_PASSWORD_QUEUE_LIMIT", "4"))
+# Niceness of the worker threads so device requests win the CPU on single-core boards
+PASSWORD_WORKER_NICENESS = int(getenv("WSMD_PASSWORD_WORKER_NICENESS", "10"))
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when the password pool already has a full queue"""
+
+
+def lower_thread_priority(niceness=PASSWORD_WORKER_NICENESS):
+    """Raise the niceness of the calling thread (Linux applies it per thread)"""
+    if not niceness or not hasattr(os, "setpriority"):
+        return
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), niceness)
+    except OSError:
+        pass
+
+
+class PasswordPool:
+    """Runs bcrypt hashing and verification off the event loop with admission control.
+
+    At most ``workers + queue_limit`` operations are accepted at once; any
+    more raise PasswordPoolBusy immediately instead of piling up behind the
+    slow hashes, so callers can answer with 429.
+    """
+
+    def __init__(self, workers=PASSWORD_WORKERS, queue_limit=PASSWORD_QUEUE_LIMIT):
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="wsmd-password", initializer=lower_thread_priority
+        )
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+
+    def submit(self, func, *args):
+        """Queue func(*args) on the pool; raises PasswordPoolBusy if the queue is full"""
+        if not self._slots.acquire(blocking=False):
+            raise PasswordPoolBusy()
+        try:
+            future = self._executor.submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    async def verify_and_update(self, password, password_hash):
+        """Return (valid, new_hash); new_hash is set when the stored hash should be upgraded"""
+        return await asyncio.wrap_future(self.submit(get_pwd_context().verify_and_update, password, password_hash))
+
+    async def hash(self, password):
+        return await asyncio.wrap_future(self.submit(get_pwd_context().hash, password))
+
+    def hash_blocking(self, password):
+        """Hash from a sync handler (already on a threadpool thread) through the same queue"""
+        return self.submit(get_pwd_context().hash, password).result()
+
+    def shutdown(self):
+        """Stop the worker threads, cancelling queued operations"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Shared pool for password hashing
+password_pool = PasswordPool()
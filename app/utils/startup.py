@@ -0,0 +1,75 @@
+import json
+import os
+import sys
+import time
+from os import getenv
+
+# Optional file the startup timing report is written to as JSON
+STARTUP_REPORT_PATH = getenv("WSMD_STARTUP_REPORT", "")
+
+
+def process_start_time(pid="self"):
+    """Wall-clock time a process was started, from /proc (None elsewhere)"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Fields after the parenthesized command name; starttime is field 22 of stat
+            fields = f.read().rpartition(")")[2].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def is_onefile_bundle():
+    """True inside a PyInstaller onefile executable, whose bootloader unpacks us first"""
+    bundle_dir = getattr(sys, "_MEIPASS", None)
+    return bundle_dir is not None and os.path.basename(bundle_dir).startswith("_MEI")
+
+
+class StartupTimer:
+    """Records how long each startup phase took, up to the first /device/hit.
+
+    Times are seconds since the process was started; inside a PyInstaller
+    onefile bundle they count from the bootloader, so the time spent
+    unpacking the bundle is included (as the "unpacked" phase).
+    """
+
+    def __init__(self):
+        now = time.time()
+        started = process_start_time()
+        self.origin = started if started is not None else now
+        self.phases = {}  # phase -> seconds since origin, in the order they happened
+        if is_onefile_bundle():
+            bootloader_started = process_start_time(os.getppid())
+            if bootloader_started is not None and started is not None:
+                self.origin = bootloader_started
+                self.phases["unpacked"] = started - bootloader_started
+        self.first_hit_seen = False
+
+    def mark(self, phase):
+        self.phases[phase] = time.time() - self.origin
+
+    def first_hit(self):
+        """Record the first device hit served by this process and print the report"""
+        if self.first_hit_seen:
+            return
+        self.first_hit_seen = True
+        self.mark("first_hit")
+        self.report()
+
+    def report(self):
+        """Print the phases so far and write them to WSMD_STARTUP_REPORT if set"""
+        print("Startup timing (seconds since process start): " + ", ".join(
+            f"{phase} {seconds:.3f}" for phase, seconds in self.phases.items()
+        ))
+        if STARTUP_REPORT_PATH:
+            try:
+                with open(STARTUP_REPORT_PATH, "w") as f:
+                    json.dump({"pid": os.getpid(), "phases": self.phases}, f, indent=2)
+            except OSError as e:
+                print(f"Error writing startup report: {e}")
+
+
+# Startup phases of this process
+startup_timer = StartupTimer()
@@ -0,0 +1,185 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+from functools import lru_cache
+from os import getenv
+
+import anyio.to_thread
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse
+
+from app.utils.http_cache import etag_matches
+
+STATIC_DIR = "app/static"
+# Fingerprinted copies live under the static directory, so they are served by
+# the same mount and bundled by the PyInstaller specs without changes
+BUILD_DIR = "build"
+MANIFEST_NAME = "manifest.json"
+ASSET_EXTENSIONS = (".css", ".js")
+
+# Fingerprinted URLs change whenever the content does, so browsers never need to revalidate
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Content-Encoding values in order of preference, with the file suffix of each variant
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+# In development the build output is ignored so edits to app/static show up on reload
+IGNORE_BUILD = getenv("ENV") == "development"
+
+
+def content_hash(data):
+    return hashlib.blake2b(data, digest_size=6).hexdigest()
+
+
+def build_assets(static_dir=STATIC_DIR):
+    """Write fingerprinted, precompressed copies of the static assets.
+
+    Every .css and .js file under static_dir is copied to
+    build/<dir>/<name>.<hash><ext> with .gz (and .br, if the brotli package is
+    installed) variants next to it, and build/manifest.json maps each original
+    path to its fingerprinted one. Previous build output is removed first.
+    Returns the manifest.
+    """
+    try:
+        import brotli
+    except ImportError:  # Optional: only gzip variants are built without it
+        brotli = None
+
+    build_dir = os.path.join(static_dir, BUILD_DIR)
+    shutil.rmtree(build_dir, ignore_errors=True)
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != build_dir)
+        for file_name in sorted(files):
+            if not file_name.endswith(ASSET_EXTENSIONS):
+                continue
+            source = os.path.join(root, file_name)
+            with open(source, "rb") as f:
+                data = f.read()
+            relative_path = os.path.relpath(source, static_dir).replace(os.sep, "/")
+            stem, extension = os.path.splitext(relative_path)
+            fingerprinted = f"{BUILD_DIR}/{stem}.{content_hash(data)}{extension}"
+            target = os.path.join(static_dir, *fingerprinted.split("/"))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, "wb") as f:
+                f.write(data)
+            # mtime=0 keeps the .gz bytes identical between builds
+            with open(target + ".gz", "wb") as f:
+                f.write(gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                with open(target + ".br", "wb") as f:
+                    f.write(brotli.compress(data, quality=11))
+            manifest[relative_path] = fingerprinted
+            print(f"{relative_path} -> {fingerprinted}")
+
+    with open(os.path.join(build_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    if brotli is None:
+        print("brotli is not installed; only gzip variants were built")
+    return manifest
+
+
+def fingerprint_of(fingerprinted_path):
+    """The content hash in a "<name>.<hash><ext>" build path"""
+    return os.path.splitext(os.path.basename(fingerprinted_path))[0].rpartition(".")[2]
+
+
+@lru_cache(maxsize=None)
+def load_manifest(static_dir=STATIC_DIR):
+    """The build manifest, or {} if build_assets has not been run (or ENV=development).
+
+    Entries whose source file changed since the build are left out, so an
+    asset edited without rebuilding is served from its original path rather
+    than as a stale copy that browsers would cache for a year.
+    """
+    if IGNORE_BUILD:
+        return {}
+    try:
+        with open(os.path.join(static_dir, BUILD_DIR, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {}
+    current = {}
+    for path, fingerprinted in manifest.items():
+        try:
+            with open(os.path.join(static_dir, *path.split("/")), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            continue
+        if content_hash(data) == fingerprint_of(fingerprinted):
+            current[path] = fingerprinted
+        else:
+            print(f"{path} changed since the static build; serving it unbuilt (run python -m app.utils.static_assets)")
+    return current
+
+
+def static_url(path):
+    """URL of a static asset: its fingerprinted copy if built, the original otherwise"""
+    return "/static/" + load_manifest().get(path, path)
+
+
+def accepted_encodings(accept_encoding):
+    """Content codings an Accept-Encoding header allows (those without q=0)"""
+    accepted = set()
+    for item in (accept_encoding or "").split(","):
+        coding, _, params = item.partition(";")
+        quality = params.strip().removeprefix("q=")
+        try:
+            if params and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that serves the build output precompressed and cached forever.
+
+    Files under build/ are content-addressed: they are sent with an immutable
+    Cache-Control and, when the client accepts it, as the .br or .gz variant
+    written by build_assets. Everything else is served as before, but
+    revalidated on every use (no-cache) since its URL does not change with
+    its content.
+    """
+
+    async def get_response(self, path, scope):
+        if path.split(os.sep)[0] != BUILD_DIR or scope["method"] not in ("GET", "HEAD"):
+            response = await super().get_response(path, scope)
+            response.headers.setdefault("cache-control", "no-cache")
+            return response
+
+        request_headers = Headers(scope=scope)
+        # The hash in the name identifies the content; each variant gets its own tag
+        fingerprint = fingerprint_of(path)
+        headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+        accepted = accepted_encodings(request_headers.get("accept-encoding"))
+        for encoding, suffix in ENCODINGS:
+            if encoding not in accepted:
+                continue
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path + suffix)
+            if stat_result is not None:
+                headers.update({"Content-Encoding": encoding, "ETag": f'"{fingerprint}-{encoding}"'})
+                break
+        else:
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path)
+            if stat_result is None:
+                return await super().get_response(path, scope)
+            headers["ETag"] = f'"{fingerprint}"'
+
+        if etag_matches(request_headers.get("if-none-match"), headers["ETag"]):
+            return NotModifiedResponse(Headers(headers))
+        return FileResponse(
+            full_path,
+            stat_result=stat_result,
+            method=scope["method"],
+            media_type=mimetypes.guess_type(path)[0],
+            headers=headers,
+        )
+
+
+if __name__ == "__main__":
+    build_assets()
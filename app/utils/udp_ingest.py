@@ -0,0 +1,130 @@
+import asyncio
+import struct
+from os import getenv
+
+from app.models.database import AsyncSessionLocal
+from app.utils.device_identity import DEVICE_IDENTITY_REQUIRED
+from app.utils.hits import apply_hits
+
+# UDP hit listener configuration (disabled unless a port is set)
+UDP_PORT = int(getenv("WSMD_UDP_PORT", "0"))
+UDP_HOST = getenv("WSMD_UDP_HOST", "0.0.0.0")
+
+# Hit packets carry the MAC unsigned, so anyone on the network could send hits for any device
+if UDP_PORT and DEVICE_IDENTITY_REQUIRED:
+    print("WSMD_UDP_PORT is ignored with WSMD_DEVICE_IDENTITY_REQUIRED=1: UDP hit packets are not signed")
+    UDP_PORT = 0
+
+# Hit packet: magic "WH", version, MAC (6 bytes), sequence number, hit count
+HIT_PACKET = struct.Struct("!2sB6sHH")
+# Ack packet: magic "WA", version, sequence number, status, counter, max_hits, order
+ACK_PACKET = struct.Struct("!2sBHBIIH")
+HIT_MAGIC = b"WH"
+ACK_MAGIC = b"WA"
+PROTOCOL_VERSION = 1
+
+ACK_OK = 0
+ACK_UNKNOWN_DEVICE = 1
+ACK_ERROR = 2
+
+
+def format_mac(raw_mac):
+    """Format 6 raw bytes as a lowercase colon-separated MAC address"""
+    return ":".join(f"{byte:02x}" for byte in raw_mac)
+
+
+def encode_hit(mac_address, sequence, count=1):
+    """Build a hit packet (used by tests, benchmarks and tooling)"""
+    raw_mac = bytes(int(part, 16) for part in mac_address.replace("-", ":").split(":"))
+    return HIT_PACKET.pack(HIT_MAGIC, PROTOCOL_VERSION, raw_mac, sequence & 0xFFFF, count)
+
+
+def encode_ack(sequence, ack_status, counter=0, max_hits=0, order=0):
+    """Build an ack packet; values outside their field's range are clamped so it always packs"""
+    return ACK_PACKET.pack(
+        ACK_MAGIC, PROTOCOL_VERSION, sequence, ack_status,
+        min(max(counter, 0), 0xFFFFFFFF), min(max(max_hits, 0), 0xFFFFFFFF), min(max(order, 0), 0xFFFF),
+    )
+
+
+def decode_ack(data):
+    """Parse an ack packet into (sequence, status, counter, max_hits, order)"""
+    magic, version, sequence, ack_status, counter, max_hits, order = ACK_PACKET.unpack(data)
+    if magic != ACK_MAGIC or version != PROTOCOL_VERSION:
+        raise ValueError("Not a WSMD ack packet")
+    return sequence, ack_status, counter, max_hits, order
+
+
+class HitDatagramProtocol(asyncio.DatagramProtocol):
+    """Applies compact binary hit packets and answers each with an ack datagram.
+
+    Devices retransmit a packet until they see its ack. The last sequence
+    number and ack are remembered per MAC, so a retransmission whose ack got
+    lost is answered again without applying the hits twice. Retransmissions
+    come from the same address and port; a packet from a different one (a
+    rebooted device that got a new lease or port) is always applied, and
+    devices start at a random sequence number so a reboot does not reuse
+    the last one.
+    """
+
+    def __init__(self):
+        self.transport = None
+        self._last_acks = {}  # mac_address -> (sequence, source addr, ack bytes)
+        self._tasks = set()  # Running _apply tasks; the loop only keeps weak references
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if len(data) != HIT_PACKET.size:
+            return
+        magic, version, raw_mac, sequence, count = HIT_PACKET.unpack(data)
+        if magic != HIT_MAGIC or version != PROTOCOL_VERSION or count == 0:
+            return
+
+        mac_address = format_mac(raw_mac)
+        last = self._last_acks.get(mac_address)
+        if last and last[:2] == (sequence, addr):
+            # Retransmission: resend the ack, or drop it while the original is still being applied
+            if last[2] is not None:
+                self.transport.sendto(last[2], addr)
+            return
+
+        self._last_acks[mac_address] = (sequence, addr, None)
+        task = asyncio.get_running_loop().create_task(self._apply(mac_address, sequence, count, addr))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _apply(self, mac_address, sequence, count, addr):
+        try:
+            async with AsyncSessionLocal() as db:
+                result = await apply_hits(db, mac_address, count)
+            if result is None:
+                self._remember(mac_address, sequence, addr, None)
+                ack = encode_ack(sequence, ACK_UNKNOWN_DEVICE)
+            else:
+                ack = encode_ack(sequence, ACK_OK, result["counter"], result["max_hits"], result["order"])
+                self._remember(mac_address, sequence, addr, ack)
+        except Exception as e:
+            print(f"Error applying UDP hit from {mac_address}: {e}")
+            self._remember(mac_address, sequence, addr, None)
+            ack = encode_ack(sequence, ACK_ERROR)
+        self.transport.sendto(ack, addr)
+
+    def _remember(self, mac_address, sequence, addr, ack):
+        """Record the ack for sequence (or forget it if ack is None) unless a newer packet took over"""
+        last = self._last_acks.get(mac_address)
+        if not last or last[:2] != (sequence, addr):
+            return
+        if ack is None:
+            del self._last_acks[mac_address]
+        else:
+            self._last_acks[mac_address] = (sequence, addr, ack)
+
+
+async def start_udp_listener(host=UDP_HOST, port=UDP_PORT):
+    """Bind the UDP hit listener; returns the transport so it can be closed on shutdown"""
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(HitDatagramProtocol, local_addr=(host, port))
+    print(f"UDP hit listener on {host}:{port}")
+    return transport
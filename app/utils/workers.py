@@ -0,0 +1,54 @@
+import os
+from contextlib import contextmanager
+from os import getenv
+
+try:
+    import fcntl
+except ImportError:  # Windows: single worker only
+    fcntl = None
+
+# Number of uvicorn worker processes started by `python -m app.main`
+WORKERS = max(1, int(getenv("WSMD_WORKERS", "1")))
+# Without flock there is no primary election, and every worker would bind the UDP port
+if WORKERS > 1 and fcntl is None:
+    print("WSMD_WORKERS > 1 needs fcntl, which this platform lacks; running a single worker")
+    WORKERS = 1
+# Seconds between a non-primary worker's attempts to take over from a primary that exited
+PRIMARY_RETRY_INTERVAL = 5
+
+_held_locks = []  # Keeps the primary lock file open for the life of the process
+
+
+@contextmanager
+def process_lock(path):
+    """Exclusive lock shared by every process on this host (no-op without fcntl)"""
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def acquire_primary(path):
+    """Try to become the primary worker; True for exactly one live process.
+
+    The lock is held until the process exits. uvicorn does not restart dead
+    workers, so the others keep calling this every PRIMARY_RETRY_INTERVAL
+    seconds and one of them takes over if the primary exits.
+    """
+    if fcntl is None:
+        return True
+    lock_file = open(path, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    lock_file.write(f"{os.getpid()}\n")
+    lock_file.flush()
+    _held_locks.append(lock_file)
+    return True
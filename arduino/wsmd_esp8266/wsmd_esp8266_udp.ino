@@ -0,0 +1,275 @@
+/*
+  WSMD ESP8266 Sensor with UDP hit packets
+
+  This sketch connects an ESP8266 to a WiFi network and communicates with the WSMD server.
+  It registers the device over HTTP during setup, then reports hits as small binary UDP
+  packets to the server's UDP hit listener (start the server with WSMD_UDP_PORT set).
+
+  Hit packet (13 bytes, network byte order):
+    "WH" | version (1) | MAC (6) | sequence (uint16) | hit count (uint16)
+  Ack packet (16 bytes, network byte order):
+    "WA" | version (1) | sequence (uint16) | status (1) | counter (uint32) | max_hits (uint32) | order (uint16)
+
+  A packet is retransmitted until its ack arrives. Hits that occur meanwhile (or while
+  WiFi is down) are counted and sent in the next packet.
+
+  Hardware:
+  - ESP8266 board (NodeMCU, Wemos D1 Mini, etc.)
+  - Sensor connected to interrupt pin (D1/GPIO5)
+
+  Required Libraries:
+  - ESP8266WiFi
+  - ESP8266HTTPClient
+  - WiFiUdp
+  - ArduinoJson (version 6.x)
+*/
+
+#include <ESP8266WiFi.h>
+#include <ESP8266HTTPClient.h>
+#include <WiFiClient.h>
+#include <WiFiUdp.h>
+#include <ArduinoJson.h>
+
+// WiFi settings - replace with your network credentials
+const char* ssid = "YOUR_WIFI_SSID";
+const char* password = "YOUR_WIFI_PASSWORD";
+
+// Server settings
+const char* serverIP = "192.168.1.100";  // Replace with your server IP address
+const int serverPort = 8000;             // Replace with your server port
+const int serverUdpPort = 8001;          // Must match WSMD_UDP_PORT on the server
+const String baseUrl = "http://" + String(serverIP) + ":" + String(serverPort);
+
+// UDP protocol
+const uint8_t protocolVersion = 1;
+const unsigned int localUdpPort = 8001;
+const unsigned long ackTimeout = 300;    // Retransmit after this many milliseconds
+WiFiUDP udp;
+uint16_t sequence = 0;
+bool awaitingAck = false;
+uint16_t inFlightCount = 0;
+unsigned long lastPacketTime = 0;
+
+// Interrupt pin configuration
+const int interruptPin = 5;  // D1 on NodeMCU/Wemos D1 Mini (GPIO5)
+volatile unsigned long lastInterruptTime = 0;
+volatile uint16_t pendingHits = 0;  // Hits not yet handed to a packet
+const unsigned long debounceTime = 200;  // Debounce time in milliseconds
+
+// LED indicator
+const int ledPin = LED_BUILTIN;  // Built-in LED for status indication
+
+// Device information
+uint8_t macAddress[6];
+int deviceOrder = 0;
+unsigned long hitCounter = 0;
+unsigned long maxHits = 0;
+
+// Status indicators
+bool isRegistered = false;
+unsigned long lastConnectionAttempt = 0;
+const unsigned long reconnectInterval = 30000;  // Try to reconnect every 30 seconds
+
+void ICACHE_RAM_ATTR handleInterrupt() {
+  unsigned long currentTime = millis();
+  if (currentTime - lastInterruptTime > debounceTime) {
+    if (pendingHits < 0xFFFF) {
+      pendingHits++;
+    }
+    lastInterruptTime = currentTime;
+  }
+}
+
+void setup() {
+  // Initialize Serial
+  Serial.begin(115200);
+  Serial.println("\n\nWSMD ESP8266 UDP Sensor Starting...");
+
+  // Initialize pins
+  pinMode(interruptPin, INPUT_PULLUP);
+  pinMode(ledPin, OUTPUT);
+  digitalWrite(ledPin, HIGH);  // LED off (ESP8266 built-in LED is active LOW)
+
+  WiFi.macAddress(macAddress);
+
+  // Set up interrupt
+  attachInterrupt(digitalPinToInterrupt(interruptPin), handleInterrupt, FALLING);
+
+  // Connect to WiFi
+  connectToWiFi();
+  udp.begin(localUdpPort);
+  // Start at a random sequence number so the server does not mistake the first
+  // packet after a reboot for a retransmission of the last one before it
+  sequence = random(0x10000);
+
+  // Register device with server
+  if (WiFi.status() == WL_CONNECTED) {
+    registerDevice();
+  }
+}
+
+void loop() {
+  // Check WiFi connection and reconnect if needed
+  if (WiFi.status() != WL_CONNECTED) {
+    unsigned long currentTime = millis();
+    if (currentTime - lastConnectionAttempt > reconnectInterval) {
+      Serial.println("WiFi disconnected. Attempting to reconnect...");
+      connectToWiFi();
+      if (WiFi.status() == WL_CONNECTED && !isRegistered) {
+        registerDevice();
+      }
+    }
+  }
+
+  if (WiFi.status() == WL_CONNECTED) {
+    receiveAck();
+
+    if (awaitingAck && millis() - lastPacketTime > ackTimeout) {
+      // No ack yet: retransmit the same packet (the server drops duplicates)
+      sendHitPacket();
+    } else if (!awaitingAck && pendingHits > 0) {
+      // Move all pending hits into the next packet
+      noInterrupts();
+      inFlightCount = pendingHits;
+      pendingHits = 0;
+      interrupts();
+      sequence++;
+      awaitingAck = true;
+      digitalWrite(ledPin, LOW);  // LED on until acked
+      sendHitPacket();
+    }
+  }
+
+  delay(10);
+}
+
+void sendHitPacket() {
+  uint8_t packet[13];
+  packet[0] = 'W';
+  packet[1] = 'H';
+  packet[2] = protocolVersion;
+  memcpy(packet + 3, macAddress, 6);
+  packet[9] = sequence >> 8;
+  packet[10] = sequence & 0xFF;
+  packet[11] = inFlightCount >> 8;
+  packet[12] = inFlightCount & 0xFF;
+
+  udp.beginPacket(serverIP, serverUdpPort);
+  udp.write(packet, sizeof(packet));
+  udp.endPacket();
+  lastPacketTime = millis();
+}
+
+void receiveAck() {
+  int size = udp.parsePacket();
+  if (size != 16) {
+    if (size > 0) {
+      udp.flush();
+    }
+    return;
+  }
+
+  uint8_t ack[16];
+  udp.read(ack, sizeof(ack));
+  if (ack[0] != 'W' || ack[1] != 'A' || ack[2] != protocolVersion) {
+    return;
+  }
+  uint16_t ackedSequence = (ack[3] << 8) | ack[4];
+  if (!awaitingAck || ackedSequence != sequence) {
+    return;  // Stale ack for an earlier packet
+  }
+
+  uint8_t status = ack[5];
+  awaitingAck = false;
+  digitalWrite(ledPin, HIGH);  // LED off
+
+  if (status == 0) {
+    hitCounter = ((unsigned long)ack[6] << 24) | ((unsigned long)ack[7] << 16) | (ack[8] << 8) | ack[9];
+    maxHits = ((unsigned long)ack[10] << 24) | ((unsigned long)ack[11] << 16) | (ack[12] << 8) | ack[13];
+    deviceOrder = (ack[14] << 8) | ack[15];
+
+    Serial.print("Hit counter: ");
+    Serial.print(hitCounter);
+    Serial.print(" / ");
+    Serial.print(maxHits);
+    Serial.print(", order: ");
+    Serial.println(deviceOrder);
+  } else {
+    // Unknown device or server error: keep the hits and register again
+    Serial.print("Hit packet rejected with status ");
+    Serial.println(status);
+    noInterrupts();
+    pendingHits += inFlightCount;
+    interrupts();
+    isRegistered = false;
+    registerDevice();
+  }
+}
+
+void connectToWiFi() {
+  WiFi.begin(ssid, password);
+  Serial.print("Connecting to WiFi");
+
+  // Try to connect for about 20 seconds
+  int attempts = 0;
+  while (WiFi.status() != WL_CONNECTED && attempts < 40) {
+    delay(500);
+    Serial.print(".");
+    attempts++;
+  }
+
+  lastConnectionAttempt = millis();
+
+  if (WiFi.status() == WL_CONNECTED) {
+    Serial.println("\nWiFi connected!");
+    Serial.print("IP address: ");
+    Serial.println(WiFi.localIP());
+  } else {
+    Serial.println("\nFailed to connect to WiFi");
+  }
+}
+
+void registerDevice() {
+  // Check WiFi connection
+  if (WiFi.status() == WL_CONNECTED) {
+    WiFiClient client;
+    HTTPClient http;
+
+    String url = baseUrl + "/device/register";
+    Serial.print("Registering device at: ");
+    Serial.println(url);
+
+    http.begin(client, url);
+    http.addHeader("Content-Type", "application/json");
+
+    // Send POST request
+    int httpResponseCode = http.POST("{}");
+
+    if (httpResponseCode > 0) {
+      String response = http.getString();
+      Serial.print("Response: ");
+      Serial.println(response);
+
+      // Parse the JSON response
+      StaticJsonDocument<256> responseDoc;
+      DeserializationError error = deserializeJson(responseDoc, response);
+
+      if (!error) {
+        deviceOrder = responseDoc["order"];
+        Serial.print("Device registered with order: ");
+        Serial.println(deviceOrder);
+        isRegistered = true;
+      } else {
+        Serial.print("JSON parsing error: ");
+        Serial.println(error.c_str());
+      }
+    } else {
+      Serial.print("Error on registration. Error code: ");
+      Serial.println(httpResponseCode);
+    }
+
+    http.end();
+  } else {
+    Serial.println("WiFi not connected");
+  }
+}
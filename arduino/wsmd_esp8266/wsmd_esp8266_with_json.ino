@@ -4,8 +4,17 @@
   This sketch connects an ESP8266 to a WiFi network and communicates with the WSMD server.
   It registers the device during setup and sends a hit notification when an interrupt occurs.
   
+  Hits are buffered in RAM and sent together to POST /device/hits, so a burst of hits
+  costs one HTTP request and hits that happen while WiFi is down are sent after reconnecting.
+  
   This version uses the ArduinoJson library for proper JSON parsing.
   
+  Signed identity (optional): set deviceSecret to the server's WSMD_DEVICE_SECRET and every
+  request carries the MAC address, a timestamp, a random nonce and an HMAC-SHA256 signature
+  (X-WSMD-* headers), so the server doesn't need to look the MAC up via ARP. This also works
+  through routers/NAT. The device has no RTC; it learns the server's clock from the
+  X-WSMD-Server-Time header of the first rejected request and retries.
+  
   Hardware:
   - ESP8266 board (NodeMCU, Wemos D1 Mini, etc.)
   - Sensor connected to interrupt pin (D1/GPIO5)
@@ -22,6 +31,7 @@
 #include <ESP8266HTTPClient.h>
 #include <WiFiClient.h>
 #include <ArduinoJson.h>
+#include <bearssl/bearssl.h>
 
 // WiFi settings - replace with your network credentials
 const char* ssid = "YOUR_WIFI_SSID";
@@ -32,12 +42,30 @@ const char* serverIP = "192.168.1.100";  // Replace with your server IP address
 const int serverPort = 8000;             // Replace with your server port
 const String baseUrl = "http://" + String(serverIP) + ":" + String(serverPort);
 
+// Signed identity - must match WSMD_DEVICE_SECRET on the server (leave empty to use ARP identity)
+const char* deviceSecret = "";
+long serverTimeOffset = 0;  // Server Unix time minus millis()/1000, learned from the server
+const char* identityResponseHeaders[] = {"X-WSMD-Server-Time"};
+
 // Interrupt pin configuration
 const int interruptPin = 5;  // D1 on NodeMCU/Wemos D1 Mini (GPIO5)
-volatile bool interruptOccurred = false;
-unsigned long lastInterruptTime = 0;
+volatile unsigned long lastInterruptTime = 0;
 const unsigned long debounceTime = 200;  // Debounce time in milliseconds
 
+// Offline hit buffer
+// Hit times (millis) are kept in a ring buffer; once it is full, further hits are
+// still counted but sent without a timestamp (the server records them on arrival).
+const int maxBufferedHitTimes = 64;
+volatile unsigned long hitTimes[maxBufferedHitTimes];
+volatile unsigned int pendingHits = 0;      // Hits not yet acknowledged by the server
+volatile unsigned int bufferedHitTimes = 0; // Entries of hitTimes in use (oldest first)
+const unsigned long batchWindow = 250;      // Wait this long after a hit to collect a burst
+const unsigned int maxBatchHits = 10000;    // Server limit per /device/hits request (MAX_BATCH_HITS)
+const unsigned long retryInterval = 2000;   // Base wait between failed batch sends
+const unsigned long retryJitter = 3000;     // Random extra wait so devices don't retry in lockstep
+unsigned long lastSendAttempt = 0;
+unsigned long sendDelay = 0;
+
 // LED indicator
 const int ledPin = LED_BUILTIN;  // Built-in LED for status indication
 
@@ -54,11 +82,59 @@ const unsigned long reconnectInterval = 30000;  // Try to reconnect every 30 sec
 void ICACHE_RAM_ATTR handleInterrupt() {
   unsigned long currentTime = millis();
   if (currentTime - lastInterruptTime > debounceTime) {
-    interruptOccurred = true;
+    if (bufferedHitTimes < maxBufferedHitTimes) {
+      hitTimes[bufferedHitTimes++] = currentTime;
+    }
+    pendingHits++;
     lastInterruptTime = currentTime;
   }
 }
 
+// Lowercase hex HMAC-SHA256 of message with deviceSecret
+String hmacSha256Hex(const String& message) {
+  br_hmac_key_context keyContext;
+  br_hmac_context context;
+  br_hmac_key_init(&keyContext, &br_sha256_vtable, deviceSecret, strlen(deviceSecret));
+  br_hmac_init(&context, &keyContext, 0);
+  br_hmac_update(&context, message.c_str(), message.length());
+  uint8_t digest[32];
+  br_hmac_out(&context, digest);
+  
+  char hex[65];
+  for (int i = 0; i < 32; i++) {
+    sprintf(hex + i * 2, "%02x", digest[i]);
+  }
+  return String(hex);
+}
+
+// Add the signed identity headers for a request to path (no-op without a secret)
+void addIdentityHeaders(HTTPClient& http, const String& path) {
+  if (strlen(deviceSecret) == 0) {
+    return;
+  }
+  String mac = WiFi.macAddress();
+  String timestamp = String(serverTimeOffset + (long)(millis() / 1000));
+  String nonce = String(RANDOM_REG32, HEX) + String(RANDOM_REG32, HEX);
+  
+  http.addHeader("X-WSMD-MAC", mac);
+  http.addHeader("X-WSMD-Timestamp", timestamp);
+  http.addHeader("X-WSMD-Nonce", nonce);
+  http.addHeader("X-WSMD-Signature", hmacSha256Hex(path + "\n" + mac + "\n" + timestamp + "\n" + nonce));
+  http.collectHeaders(identityResponseHeaders, 1);
+}
+
+// After a 401, adopt the server's clock so the next signed request is accepted.
+// Returns true if the clock was corrected.
+bool learnServerTime(HTTPClient& http) {
+  String serverTime = http.header("X-WSMD-Server-Time");
+  if (serverTime.length() == 0) {
+    return false;
+  }
+  serverTimeOffset = serverTime.toInt() - (long)(millis() / 1000);
+  Serial.println("Synchronized clock with server");
+  return true;
+}
+
 void setup() {
   // Initialize Serial
   Serial.begin(115200);
@@ -69,6 +145,9 @@ void setup() {
   pinMode(ledPin, OUTPUT);
   digitalWrite(ledPin, HIGH);  // LED off (ESP8266 built-in LED is active LOW)
   
+  // Seed per device so retry jitter differs across the fleet
+  randomSeed(ESP.getChipId());
+  
   // Set up interrupt
   attachInterrupt(digitalPinToInterrupt(interruptPin), handleInterrupt, FALLING);
   
@@ -91,18 +170,27 @@ void loop() {
       if (WiFi.status() == WL_CONNECTED && !isRegistered) {
         registerDevice();
       }
+      // Spread the first send of buffered hits after a reconnect
+      lastSendAttempt = millis();
+      sendDelay = random(retryJitter);
     }
   }
   
-  // Check if an interrupt has occurred and we're connected
-  if (interruptOccurred && WiFi.status() == WL_CONNECTED) {
-    Serial.println("Interrupt detected!");
+  // Send buffered hits once a burst has settled and we're connected
+  unsigned long now = millis();
+  if (pendingHits > 0 && WiFi.status() == WL_CONNECTED &&
+      now - lastInterruptTime > batchWindow && now - lastSendAttempt > sendDelay) {
+    Serial.println("Sending buffered hits...");
     
     // Visual indicator - blink LED
     digitalWrite(ledPin, LOW);  // LED on
     
-    sendHitNotification();
-    interruptOccurred = false;
+    lastSendAttempt = now;
+    if (sendHitBatch()) {
+      sendDelay = 0;
+    } else {
+      sendDelay = retryInterval + random(retryJitter);
+    }
     
     digitalWrite(ledPin, HIGH);  // LED off
   }
@@ -144,16 +232,23 @@ void registerDevice() {
     Serial.print("Registering device at: ");
     Serial.println(url);
     
-    http.begin(client, url);
-    http.addHeader("Content-Type", "application/json");
-    
     // Create empty JSON document for the request
     StaticJsonDocument<64> requestDoc;
     String requestBody;
     serializeJson(requestDoc, requestBody);
     
-    // Send POST request
-    int httpResponseCode = http.POST(requestBody);
+    // Send POST request (again once if the server corrected our clock)
+    int httpResponseCode = 0;
+    for (int attempt = 0; attempt < 2; attempt++) {
+      http.begin(client, url);
+      http.addHeader("Content-Type", "application/json");
+      addIdentityHeaders(http, "/device/register");
+      httpResponseCode = http.POST(requestBody);
+      if (httpResponseCode != 401 || !learnServerTime(http)) {
+        break;
+      }
+      http.end();
+    }
     
     if (httpResponseCode > 0) {
       String response = http.getString();
@@ -194,60 +289,119 @@ void registerDevice() {
   }
 }
 
-void sendHitNotification() {
-  // Check WiFi connection
-  if (WiFi.status() == WL_CONNECTED) {
-    WiFiClient client;
-    HTTPClient http;
-    
-    String url = baseUrl + "/device/hit";
-    Serial.print("Sending hit notification to: ");
-    Serial.println(url);
-    
-    http.begin(client, url);
-    http.addHeader("Content-Type", "application/json");
+// Remove the first count hits (and their timestamps) from the buffer
+void dropSentHits(unsigned int count, unsigned int timedCount) {
+  noInterrupts();
+  pendingHits -= count;
+  for (unsigned int i = timedCount; i < bufferedHitTimes; i++) {
+    hitTimes[i - timedCount] = hitTimes[i];
+  }
+  bufferedHitTimes -= timedCount;
+  interrupts();
+}
+
+// Send buffered hits (up to maxBatchHits) in one request. Returns true if the next batch can be sent
+// right away: the server accepted (or permanently rejected) these, or the device registered again.
+bool sendHitBatch() {
+  if (WiFi.status() != WL_CONNECTED) {
+    Serial.println("WiFi not connected");
+    return false;
+  }
+  
+  // Snapshot the buffer; hits arriving during the request (or beyond maxBatchHits) stay pending
+  noInterrupts();
+  unsigned int count = pendingHits;
+  if (count > maxBatchHits) {
+    count = maxBatchHits;
+  }
+  unsigned int timedCount = bufferedHitTimes;
+  if (timedCount > count) {
+    timedCount = count;
+  }
+  unsigned long times[maxBufferedHitTimes];
+  for (unsigned int i = 0; i < timedCount; i++) {
+    times[i] = hitTimes[i];
+  }
+  interrupts();
+  
+  WiFiClient client;
+  HTTPClient http;
+  
+  String url = baseUrl + "/device/hits";
+  Serial.print("Sending ");
+  Serial.print(count);
+  Serial.print(" hit(s) to: ");
+  Serial.println(url);
+  
+  http.begin(client, url);
+  http.addHeader("Content-Type", "application/json");
+  addIdentityHeaders(http, "/device/hits");
+  
+  // {"count": n, "ages_ms": [...]} - ages let the server timestamp hits without an RTC
+  DynamicJsonDocument requestDoc(128 + maxBufferedHitTimes * 16);
+  requestDoc["count"] = count;
+  JsonArray ages = requestDoc.createNestedArray("ages_ms");
+  unsigned long now = millis();
+  for (unsigned int i = 0; i < timedCount; i++) {
+    ages.add(now - times[i]);
+  }
+  String requestBody;
+  serializeJson(requestDoc, requestBody);
+  
+  int httpResponseCode = http.POST(requestBody);
+  bool accepted = false;
+  
+  if (httpResponseCode == 200) {
+    String response = http.getString();
+    Serial.print("Response: ");
+    Serial.println(response);
     
-    // Create empty JSON document for the request
-    StaticJsonDocument<64> requestDoc;
-    String requestBody;
-    serializeJson(requestDoc, requestBody);
+    dropSentHits(count, timedCount);
+    accepted = true;
     
-    // Send POST request
-    int httpResponseCode = http.POST(requestBody);
+    // Parse the JSON response
+    StaticJsonDocument<256> responseDoc;
+    DeserializationError error = deserializeJson(responseDoc, response);
     
-    if (httpResponseCode > 0) {
-      String response = http.getString();
-      Serial.print("HTTP Response code: ");
-      Serial.println(httpResponseCode);
-      Serial.print("Response: ");
-      Serial.println(response);
+    if (!error) {
+      hitCounter = responseDoc["counter"];
+      maxHits = responseDoc["max_hits"];
+      deviceOrder = responseDoc["order"];
       
-      // Parse the JSON response
-      StaticJsonDocument<256> responseDoc;
-      DeserializationError error = deserializeJson(responseDoc, response);
-      
-      if (!error) {
-        hitCounter = responseDoc["counter"];
-        maxHits = responseDoc["max_hits"];
-        deviceOrder = responseDoc["order"];
-        
-        Serial.print("Hit counter: ");
-        Serial.println(hitCounter);
-        Serial.print("Max hits: ");
-        Serial.println(maxHits);
-        Serial.print("Device order: ");
-        Serial.println(deviceOrder);
-      } else {
-        Serial.print("JSON parsing error: ");
-        Serial.println(error.c_str());
-      }
+      Serial.print("Hit counter: ");
+      Serial.println(hitCounter);
+      Serial.print("Max hits: ");
+      Serial.println(maxHits);
+      Serial.print("Device order: ");
+      Serial.println(deviceOrder);
     } else {
-      Serial.print("Error on sending hit. Error code: ");
-      Serial.println(httpResponseCode);
+      Serial.print("JSON parsing error: ");
+      Serial.println(error.c_str());
     }
-    
+  } else if (httpResponseCode == 400) {
+    // Unknown to the server (e.g. its database was reset): register again and
+    // resend the same hits right away if that worked, otherwise after the retry delay
+    Serial.println("Device not recognised by the server; registering again");
     http.end();
+    isRegistered = false;
+    registerDevice();
+    return isRegistered;
+  } else if (httpResponseCode > 401 && httpResponseCode < 500 &&
+             httpResponseCode != 408 && httpResponseCode != 429) {
+    // Rejected as invalid (e.g. 422): resending the same batch can never succeed
+    Serial.print("Server rejected the hits, dropping them. Error code: ");
+    Serial.println(httpResponseCode);
+    dropSentHits(count, timedCount);
+    accepted = true;
   } else {
-    Serial.println("WiFi not connected");
+    // Keep the hits buffered and retry later (with a corrected clock after a 401)
+    if (httpResponseCode == 401) {
+      learnServerTime(http);
+    }
+    Serial.print("Error on sending hits. Error code: ");
+    Serial.println(httpResponseCode);
   }
+  
+  http.end();
+  return accepted;
 }
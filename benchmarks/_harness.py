@@ -0,0 +1,44 @@
+"""
+Shared setup for the benchmarks that run the app in-process under uvicorn.
+
+Importing this module points the app at a throwaway database (unless
+WSMD_DATABASE_PATH is already set), so import it before anything from app.
+Simulated device i connects from device_ip(i) via X-Forwarded-For and is
+resolved to device_mac(i) by the fake MAC table.
+"""
+import os
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("WSMD_DATABASE_PATH", os.path.join(tempfile.mkdtemp(prefix="wsmd-bench-"), "wsmd.db"))
+
+import uvicorn
+
+
+def device_ip(index):
+    return f"10.200.{index // 250}.{index % 250 + 1}"
+
+
+def device_mac(index):
+    return f"02:00:00:00:{index // 256:02x}:{index % 256:02x}"
+
+
+def use_fake_mac_table(devices):
+    """Resolve the first `devices` synthetic addresses without ARP"""
+    from app.utils.mac_resolver import mac_resolver
+
+    fake_table = {device_ip(i): device_mac(i) for i in range(devices)}
+    mac_resolver.lookup = fake_table.get
+
+
+def start_server(app, port):
+    """Run app with uvicorn in a daemon thread; returns once it accepts connections.
+
+    Set server.should_exit = True on the returned server to stop it.
+    """
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
@@ -0,0 +1,125 @@
+"""
+Cost of building the device list payload for /admin/devices and SSE.
+
+On a throwaway database with N devices, compares per request:
+
+    orm+pydantic  SELECT Device ORM objects, validate them as List[DeviceModel]
+                  and serialize (what /admin/devices did before)
+    rows+json     SELECT plain columns and encode with the standard library
+    rows+orjson   the same with orjson (skipped if it is not installed)
+    snapshot      GET /admin/devices today when nothing changed: one
+                  PRAGMA data_version, then the shared bytes
+
+and the time to produce one device snapshot event for S SSE subscribers when
+it is encoded per subscriber vs. once and shared.
+
+Usage:
+    python -m benchmarks.admin_payloads [--devices 200] [--subscribers 10] [--iterations 200]
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from typing import List
+
+# Point the app at a throwaway database before importing it
+os.environ.setdefault("WSMD_DATABASE_PATH", os.path.join(tempfile.mkdtemp(prefix="wsmd-bench-"), "wsmd.db"))
+
+from pydantic import TypeAdapter
+from sqlalchemy import select
+
+from app.models.database import AsyncSessionLocal, Device, SessionLocal, async_engine, init_schema
+from app.routers.admin import DeviceModel
+from app.utils.change_feed import change_feed, get_device_data, format_event
+from app.utils.json_encoding import encode_stdlib, load_encoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+async def orm_pydantic(adapter):
+    async with AsyncSessionLocal() as db:
+        devices = (await db.execute(select(Device))).scalars().all()
+    return adapter.dump_json(adapter.validate_python(devices, from_attributes=True))
+
+
+async def rows(encode):
+    async with AsyncSessionLocal() as db:
+        return encode(await get_device_data(db))
+
+
+async def snapshot():
+    return (await change_feed.snapshot()).devices_json
+
+
+async def time_async(func, iterations, *args):
+    await func(*args)  # Warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await func(*args)
+    return (time.perf_counter() - start) / iterations
+
+
+def time_sync(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations
+
+
+async def run(args):
+    adapter = TypeAdapter(List[DeviceModel])
+    cases = [
+        ("orm+pydantic", orm_pydantic, adapter),
+        ("rows+json", rows, encode_stdlib),
+    ]
+    if orjson is not None:
+        cases.append(("rows+orjson", rows, orjson.dumps))
+    cases.append(("snapshot", snapshot))
+
+    print(f"/admin/devices payload, {args.devices} devices:")
+    for name, func, *extra in cases:
+        seconds = await time_async(func, args.iterations, *extra)
+        print(f"  {name:<13} {seconds * 1e3:8.3f} ms/request")
+
+    async with AsyncSessionLocal() as db:
+        devices = await get_device_data(db)
+    encode = load_encoder()
+    per_subscriber = time_sync(
+        lambda: [f"event: devices\ndata: {json.dumps(devices)}\n\n".encode() for _ in range(args.subscribers)],
+        args.iterations,
+    )
+    shared = time_sync(lambda: format_event("devices", encode(devices)), args.iterations)
+    print(f"SSE devices snapshot for {args.subscribers} subscribers:")
+    print(f"  per subscriber {per_subscriber * 1e3:8.3f} ms")
+    print(f"  encoded once   {shared * 1e3:8.3f} ms ({encode.__module__}.{encode.__name__})")
+    await change_feed.close()
+    await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--subscribers", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    init_schema()
+    db = SessionLocal()
+    db.add_all(
+        Device(mac_address=f"02:00:00:08:{i // 256:02x}:{i % 256:02x}", order=i + 1, hit_counter=i % 7,
+               max_hits=100, name=f"Device-{i}")
+        for i in range(args.devices)
+    )
+    db.commit()
+    db.close()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
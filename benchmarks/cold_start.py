@@ -0,0 +1,144 @@
+"""
+Measure time from launching the server to its first answered /device/hit.
+
+Each run starts a fresh server process the way ``python -m app.main`` does
+(schema check, then uvicorn with the already-built app) and a device that
+keeps calling POST /device/register and POST /device/hit with signed
+identity headers until a hit succeeds, as a sensor does after a power cut.
+Two cases are measured:
+
+    existing  the database is already at the current schema version
+    fresh     no database file yet, so the schema is created on start
+
+The server's own startup report (WSMD_STARTUP_REPORT) is collected too, so
+the median time of each phase since process start is shown next to the
+end-to-end time seen by the device.
+
+Usage:
+    python -m benchmarks.cold_start [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+
+SERVE_PORT = 8772
+SECRET = "cold-start-secret"
+MAC_ADDRESS = "02:00:00:06:00:01"
+
+
+def serve(port):
+    """Child process: what python -m app.main does, minus the Raspberry Pi network checks"""
+    from app.main import app
+    from app.models.database import init_schema
+    import uvicorn
+
+    init_schema()
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def prepare_existing(db_path):
+    """A database at the current schema with the device already registered"""
+    env = dict(os.environ, WSMD_DATABASE_PATH=db_path)
+    code = (
+        "from app.models.database import init_schema, SessionLocal, Device\n"
+        "init_schema()\n"
+        "db = SessionLocal()\n"
+        f"db.add(Device(mac_address='{MAC_ADDRESS}', order=1, max_hits=100, name='cold-start'))\n"
+        "db.commit()\n"
+    )
+    subprocess.run([sys.executable, "-c", code], env=env, check=True)
+
+
+def signed_headers(path):
+    from app.utils.device_identity import sign_identity
+
+    timestamp = str(int(time.time()))
+    nonce = uuid.uuid4().hex
+    return {
+        "X-WSMD-MAC": MAC_ADDRESS,
+        "X-WSMD-Timestamp": timestamp,
+        "X-WSMD-Nonce": nonce,
+        "X-WSMD-Signature": sign_identity(SECRET, path, MAC_ADDRESS, timestamp, nonce),
+    }
+
+
+def first_hit(base_url, process, timeout=60):
+    """Retry register + hit like a booting sensor; seconds until a hit is answered"""
+    registered = False
+    deadline = time.perf_counter() + timeout
+    with httpx.Client(base_url=base_url, timeout=2) as client:
+        while time.perf_counter() < deadline:
+            if process.poll() is not None:
+                sys.exit("Server process exited during startup")
+            try:
+                if not registered:
+                    registered = client.post("/device/register", headers=signed_headers("/device/register")).status_code == 200
+                if registered and client.post("/device/hit", headers=signed_headers("/device/hit")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.01)
+    sys.exit("No hit answered before the timeout")
+
+
+def run_once(case, port):
+    tmp_dir = tempfile.mkdtemp(prefix="wsmd-bench-")
+    db_path = os.path.join(tmp_dir, "wsmd.db")
+    report_path = os.path.join(tmp_dir, "startup.json")
+    if case == "existing":
+        prepare_existing(db_path)
+
+    env = dict(os.environ, WSMD_DATABASE_PATH=db_path, WSMD_DEVICE_SECRET=SECRET, WSMD_STARTUP_REPORT=report_path)
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.cold_start", "--serve", "--port", str(port)],
+        env=env, stdout=subprocess.DEVNULL,
+    )
+    try:
+        first_hit(f"http://127.0.0.1:{port}", process)
+        elapsed = time.perf_counter() - start
+        # The report is rewritten when the first hit is served
+        for _ in range(100):
+            with open(report_path) as f:
+                phases = json.load(f)["phases"]
+            if "first_hit" in phases:
+                break
+            time.sleep(0.01)
+    finally:
+        process.terminate()
+        process.wait()
+    return elapsed, phases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port)
+        return
+
+    for case in ("existing", "fresh"):
+        results = [run_once(case, args.port) for _ in range(args.runs)]
+        elapsed = statistics.median(result[0] for result in results)
+        phase_names = list(results[0][1])
+        phases = ", ".join(
+            f"{name} {statistics.median(result[1].get(name, 0.0) for result in results):.3f}" for name in phase_names
+        )
+        print(f"  {case:<9} first hit answered after {elapsed:.3f} s (median of {args.runs})")
+        print(f"            server phases: {phases}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Time Tkinter dashboard table updates for different device counts.
+
+For each device count the table is first rendered from scratch (what every
+data change used to cost, since all labels were destroyed and recreated),
+then updated repeatedly with a single hit counter changed (the common case
+with persistent per-device labels). Each timing includes the Tk layout and
+redraw (root.update()).
+
+Needs a display; on a headless machine run it under xvfb-run.
+
+Usage:
+    python -m benchmarks.dashboard_render [--devices 10 50 200] [--updates 50]
+"""
+import argparse
+import statistics
+import time
+import tkinter as tk
+
+from dashboard.main import DeviceDashboard
+
+
+def make_devices(count):
+    return [
+        {"mac_address": f"02:00:00:00:{i // 256:02x}:{i % 256:02x}", "hit_counter": 0, "max_hits": 10, "name": f"D{i + 1}"}
+        for i in range(count)
+    ]
+
+
+def timed_update(root, dashboard, devices):
+    dashboard.devices = devices
+    start = time.perf_counter()
+    dashboard.update_device_table()
+    root.update()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--updates", type=int, default=50, help="Single-counter updates timed per device count")
+    args = parser.parse_args()
+
+    root = tk.Tk()
+    dashboard = DeviceDashboard(root, start_refresh=False)
+    root.update()
+
+    for count in args.devices:
+        # Start from an empty table so every label is created
+        timed_update(root, dashboard, [])
+        devices = make_devices(count)
+        full_render = timed_update(root, dashboard, devices)
+
+        single_change = []
+        for i in range(args.updates):
+            devices = [dict(device) for device in devices]
+            devices[i % count]["hit_counter"] += 1
+            single_change.append(timed_update(root, dashboard, devices))
+
+        print(f"{count:>4} devices: full render {full_render:8.2f} ms   "
+              f"one counter changed {statistics.mean(single_change):7.2f} ms (mean of {args.updates})")
+
+    root.destroy()
+
+
+if __name__ == "__main__":
+    main()
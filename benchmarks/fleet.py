@@ -0,0 +1,249 @@
+"""
+Simulate a fleet of ESP8266 sensors against one server and report what it sustains.
+
+The server runs in a child process (so the load generator does not compete
+with it for the GIL) on a throwaway database, with the MAC resolver replaced
+by a fake that derives a MAC from the synthetic client IP sent in
+X-Forwarded-For. Each simulated device calls POST /device/register once and
+then POST /device/hit at the given rate, while logged-in admin clients keep
+GET /admin/events (SSE) open.
+
+The report gives throughput, p50/p95/p99/max latency and error rate per
+operation and is written as JSON so runs can be compared across releases.
+Server settings (WSMD_WRITE_BEHIND, WSMD_SQLITE_PROFILE, ...) are taken from
+the environment and recorded in the results.
+
+Usage:
+    python -m benchmarks.fleet [--devices 50] [--rate 2] [--duration 30] [--sse-clients 2]
+                               [--new-connections] [--output results.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+SERVE_PORT = 8769
+USERNAME = "fleet"
+PASSWORD = "fleet"
+
+
+def device_ip(index):
+    return f"10.203.{index // 250}.{index % 250 + 1}"
+
+
+def fake_mac(ip):
+    """MAC for a synthetic fleet address, None for anything else"""
+    parts = ip.split(".")
+    if len(parts) != 4 or parts[:2] != ["10", "203"]:
+        return None
+    return f"02:00:00:03:{int(parts[2]):02x}:{int(parts[3]):02x}"
+
+
+def serve(port):
+    """Child process: run the app with the fake MAC resolver and a known admin user"""
+    from app.main import app
+    from app.models.database import SessionLocal, User, init_schema
+    from app.utils.auth import get_password_hash
+    from app.utils.mac_resolver import mac_resolver
+    import uvicorn
+
+    mac_resolver.lookup = fake_mac
+    mac_resolver.resolve = fake_mac
+
+    init_schema()
+    db = SessionLocal()
+    db.add(User(username=USERNAME, password_hash=get_password_hash(PASSWORD), is_key_user=True))
+    db.commit()
+    db.close()
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def summarize(latencies, errors, elapsed):
+    """Throughput and latency percentiles (ms) for one operation"""
+    total = len(latencies) + errors
+    result = {
+        "requests": total,
+        "errors": errors,
+        "error_rate": errors / total if total else 0.0,
+        "throughput_per_s": len(latencies) / elapsed if elapsed else 0.0,
+    }
+    if latencies:
+        ordered = sorted(latencies)
+        for name, fraction in (("p50_ms", 0.50), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+            result[name] = ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000
+        result["max_ms"] = ordered[-1] * 1000
+    return result
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {"register": [], "hit": []}
+        self.errors = {"register": 0, "hit": 0}
+        self.error_samples = []
+        self.sse_events = 0
+        self.sse_errors = 0
+
+    async def timed(self, operation, client, path, headers):
+        start = time.perf_counter()
+        try:
+            response = await client.post(path, headers=headers)
+            ok = response.status_code == 200
+            if not ok and len(self.error_samples) < 10:
+                self.error_samples.append(f"{operation}: HTTP {response.status_code}")
+        except httpx.HTTPError as e:
+            ok = False
+            if len(self.error_samples) < 10:
+                self.error_samples.append(f"{operation}: {type(e).__name__}")
+        if ok:
+            self.latencies[operation].append(time.perf_counter() - start)
+        else:
+            self.errors[operation] += 1
+        return ok
+
+
+async def run_device(index, args, base_url, recorder, deadline):
+    headers = {"X-Forwarded-For": device_ip(index)}
+    if args.new_connections:
+        headers["Connection"] = "close"  # Like ESP8266HTTPClient: a new TCP connection per request
+    async with httpx.AsyncClient(base_url=base_url, timeout=10) as client:
+        # Devices power up at slightly different times
+        await asyncio.sleep(random.uniform(0, 1))
+        if not await recorder.timed("register", client, "/device/register", headers):
+            return
+        interval = 1 / args.rate
+        next_hit = time.perf_counter() + random.uniform(0, interval)
+        while True:
+            delay = next_hit - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if time.perf_counter() >= deadline:
+                return
+            await recorder.timed("hit", client, "/device/hit", headers)
+            next_hit += interval
+
+
+async def run_sse_client(base_url, recorder, deadline):
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        try:
+            await client.post("/token", data={"username": USERNAME, "password": PASSWORD})
+            async with client.stream("GET", "/admin/events") as response:
+                if response.status_code != 200:
+                    recorder.sse_errors += 1
+                    return
+                async for line in response.aiter_lines():
+                    if line.startswith("event:"):
+                        recorder.sse_events += 1
+                    if time.perf_counter() >= deadline:
+                        return
+        except httpx.HTTPError:
+            recorder.sse_errors += 1
+
+
+async def run_load(args, base_url):
+    recorder = Recorder()
+    start = time.perf_counter()
+    deadline = start + args.duration
+    sse_tasks = [asyncio.create_task(run_sse_client(base_url, recorder, deadline)) for _ in range(args.sse_clients)]
+    await asyncio.gather(*(run_device(i, args, base_url, recorder, deadline) for i in range(args.devices)))
+    elapsed = time.perf_counter() - start
+    for task in sse_tasks:
+        task.cancel()
+    await asyncio.gather(*sse_tasks, return_exceptions=True)
+    return recorder, elapsed
+
+
+def wait_for_server(base_url, process):
+    for _ in range(200):
+        if process.poll() is not None:
+            sys.exit("Server process exited during startup")
+        try:
+            httpx.get(f"{base_url}/login", timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    sys.exit("Server did not start")
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=2.0, help="Hits per second per device")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of load")
+    parser.add_argument("--sse-clients", type=int, default=2)
+    parser.add_argument("--new-connections", action="store_true", help="Open a new connection for every request")
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--output", default=f"fleet-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port)
+        return
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    env = dict(os.environ)
+    env.setdefault("WSMD_DATABASE_PATH", os.path.join(tempfile.mkdtemp(prefix="wsmd-bench-"), "wsmd.db"))
+    server = subprocess.Popen([sys.executable, "-m", "benchmarks.fleet", "--serve", "--port", str(args.port)], env=env)
+    try:
+        wait_for_server(base_url, server)
+        print(f"{args.devices} devices x {args.rate} hits/s for {args.duration:.0f} s, {args.sse_clients} SSE clients")
+        recorder, elapsed = asyncio.run(run_load(args, base_url))
+    finally:
+        server.terminate()
+        server.wait()
+
+    results = {
+        "config": {
+            "devices": args.devices,
+            "rate_per_device": args.rate,
+            "duration_s": args.duration,
+            "sse_clients": args.sse_clients,
+            "new_connections": args.new_connections,
+            "server_env": {key: value for key, value in env.items() if key.startswith("WSMD_") and key != "WSMD_DATABASE_PATH"},
+        },
+        "environment": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "elapsed_s": elapsed,
+        "operations": {
+            operation: summarize(recorder.latencies[operation], recorder.errors[operation], elapsed)
+            for operation in ("register", "hit")
+        },
+        "sse": {"clients": args.sse_clients, "events_received": recorder.sse_events, "errors": recorder.sse_errors},
+        "error_samples": recorder.error_samples,
+    }
+
+    for operation, summary in results["operations"].items():
+        line = f"  {operation:<9} {summary['throughput_per_s']:8.1f} req/s   errors {summary['errors']} ({summary['error_rate']:.1%})"
+        if "p50_ms" in summary:
+            line += f"   p50 {summary['p50_ms']:.1f}  p95 {summary['p95_ms']:.1f}  p99 {summary['p99_ms']:.1f}  max {summary['max_ms']:.1f} ms"
+        print(line)
+    print(f"  sse       {recorder.sse_events} events received, {recorder.sse_errors} errors")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
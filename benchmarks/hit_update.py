@@ -0,0 +1,111 @@
+"""
+Per-hit database cost of the ways the hit counter has been updated.
+
+Runs the same number of sequential hits against one device on a throwaway
+database, each in its own transaction on the app's async engine:
+
+    orm       original path: SELECT the device by MAC, increment the ORM
+              attribute, commit (the trigger resets at max_hits), refresh
+    two-step  UPDATE with the rollover in SQL, then SELECT the new state
+    returning UPDATE ... RETURNING built once and run as a Core statement
+              (what /device/hit uses when SQLite >= 3.35)
+
+and reports microseconds and SQL statements per hit.
+
+Usage:
+    python -m benchmarks.hit_update [--hits 5000]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+# Point the app at a throwaway database before importing it
+os.environ.setdefault("WSMD_DATABASE_PATH", os.path.join(tempfile.mkdtemp(prefix="wsmd-bench-"), "wsmd.db"))
+
+from sqlalchemy import event, select, update
+
+from app.models.database import AsyncSessionLocal, Device, SessionLocal, async_engine, init_schema
+from app.utils.hits import SQLITE_HAS_RETURNING, rollover_expression, write_hits
+
+MAC_ADDRESS = "02:00:00:07:00:01"
+MAX_HITS = 1000
+
+
+async def hit_orm(db, device_id):
+    device = (await db.execute(select(Device).where(Device.mac_address == MAC_ADDRESS))).scalars().first()
+    device.hit_counter += 1
+    await db.commit()
+    await db.refresh(device)
+    return device.hit_counter
+
+
+async def hit_two_step(db, device_id):
+    await db.execute(
+        update(Device).where(Device.id == device_id).values(hit_counter=rollover_expression(1))
+        .execution_options(synchronize_session=False)
+    )
+    row = (await db.execute(select(Device.hit_counter).where(Device.id == device_id))).first()
+    await db.commit()
+    return row.hit_counter
+
+
+async def hit_returning(db, device_id):
+    return (await write_hits(db, device_id, 1)).hit_counter
+
+
+VARIANTS = {"orm": hit_orm, "two-step": hit_two_step, "returning": hit_returning}
+
+
+async def run(variant, hits, device_id, statements):
+    hit = VARIANTS[variant]
+    latencies = []
+    start_statements = statements[0]
+    async with AsyncSessionLocal() as db:
+        for _ in range(hits):
+            start = time.perf_counter()
+            await hit(db, device_id)
+            latencies.append(time.perf_counter() - start)
+    return latencies, (statements[0] - start_statements) / hits
+
+
+async def run_all(hits, device_id, statements):
+    for variant in VARIANTS:
+        # Warm up connections and statement caches
+        await run(variant, 50, device_id, statements)
+        latencies, per_hit = await run(variant, hits, device_id, statements)
+        latencies.sort()
+        print(f"  {variant:<9} mean {statistics.mean(latencies) * 1e6:7.1f} us   "
+              f"p50 {latencies[len(latencies) // 2] * 1e6:7.1f} us   "
+              f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:7.1f} us   "
+              f"{per_hit:.1f} statements/hit")
+    await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hits", type=int, default=5000)
+    args = parser.parse_args()
+
+    init_schema()
+    db = SessionLocal()
+    device = Device(mac_address=MAC_ADDRESS, order=1, max_hits=MAX_HITS, name="bench")
+    db.add(device)
+    db.commit()
+    device_id = device.id
+    db.close()
+
+    statements = [0]
+
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def count_statement(*_):
+        statements[0] += 1
+
+    print(f"SQLite UPDATE ... RETURNING available: {SQLITE_HAS_RETURNING}; {args.hits} hits per variant")
+    asyncio.run(run_all(args.hits, device_id, statements))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Measure /device/hit latency while people log in.
+
+Starts the app with uvicorn on a throwaway database and a fake MAC table,
+then times hits from one device, first on an idle server and then while
+several clients hammer POST /token with a valid password. Refused logins
+(429) are counted separately.
+
+Usage:
+    python -m benchmarks.login_load [--hits 300] [--login-clients 8]
+"""
+import argparse
+import statistics
+import threading
+import time
+
+# Imported first: the harness chooses the database the app opens
+from benchmarks._harness import device_ip, start_server, use_fake_mac_table
+
+import httpx
+
+from app.main import app
+from app.models.database import SessionLocal, User, init_schema
+from app.utils.auth import get_password_hash, BCRYPT_ROUNDS
+
+HTTP_PORT = 8767
+BASE_URL = f"http://127.0.0.1:{HTTP_PORT}"
+DEVICE_IP = device_ip(0)
+
+
+def time_hits(hits):
+    latencies = []
+    with httpx.Client(base_url=BASE_URL, headers={"X-Forwarded-For": DEVICE_IP}) as client:
+        for _ in range(hits):
+            start = time.perf_counter()
+            client.post("/device/hit")
+            latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(label, latencies):
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"  {label:<18} p50 {statistics.median(latencies):7.2f} ms   p95 {p95:7.2f} ms   max {latencies[-1]:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hits", type=int, default=300)
+    parser.add_argument("--login-clients", type=int, default=8)
+    args = parser.parse_args()
+
+    use_fake_mac_table(1)
+
+    init_schema()
+    db = SessionLocal()
+    db.add(User(username="bench", password_hash=get_password_hash("bench"), is_key_user=True))
+    db.commit()
+    db.close()
+
+    server = start_server(app, HTTP_PORT)
+    httpx.post(f"{BASE_URL}/device/register", headers={"X-Forwarded-For": DEVICE_IP})
+
+    print(f"bcrypt rounds {BCRYPT_ROUNDS}, {args.hits} hits, {args.login_clients} login clients")
+    report("idle", time_hits(args.hits))
+
+    stop = threading.Event()
+    outcomes = {}
+
+    def log_in():
+        with httpx.Client(base_url=BASE_URL) as client:
+            while not stop.is_set():
+                status_code = client.post("/token", data={"username": "bench", "password": "bench"}).status_code
+                outcomes[status_code] = outcomes.get(status_code, 0) + 1
+                if status_code == 429:
+                    time.sleep(0.05)
+
+    threads = [threading.Thread(target=log_in) for _ in range(args.login_clients)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.5)
+    report("during logins", time_hits(args.hits))
+    stop.set()
+    for thread in threads:
+        thread.join()
+    print(f"  login responses    {dict(sorted(outcomes.items()))}")
+
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark MAC resolution: per-request ``arp`` subprocess vs. the cached resolver
+vs. verifying signed device identity headers (no network lookup at all), with
+nonces remembered in memory (one worker) and in the shared SQLite table used
+with WSMD_WORKERS > 1.
+
+Usage:
+    python -m benchmarks.mac_resolution [--ip 192.168.4.2] [--iterations 200]
+
+When no IP is given, the first complete entry of /proc/net/arp is used.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from types import SimpleNamespace
+
+# The shared nonce table goes in the harness's throwaway database
+from benchmarks._harness import device_mac
+
+from app.models.database import init_schema
+from app.utils import device_identity
+from app.utils.device_identity import NonceCache, SharedNonceCache, sign_identity, verify_signed_identity
+from app.utils.mac_resolver import MacResolver, read_proc_arp
+from app.utils.network import resolve_mac_from_ip
+
+
+def time_calls(func, ip_address, iterations):
+    """Call func(ip_address) repeatedly and return per-call timings in microseconds"""
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func(ip_address)
+        timings.append((time.perf_counter() - start) * 1_000_000)
+    return timings
+
+
+def report(label, timings):
+    timings = sorted(timings)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(f"{label:<28} mean {statistics.mean(timings):>10.1f} us   "
+          f"p50 {statistics.median(timings):>10.1f} us   p99 {p99:>10.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ip", help="IP address to resolve")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    ip_address = args.ip or next(iter(read_proc_arp()), "127.0.0.1")
+    print(f"Resolving {ip_address} ({args.iterations} iterations)")
+    print(f"subprocess result: {resolve_mac_from_ip(ip_address)}")
+
+    resolver = MacResolver()
+    print(f"resolver result:   {resolver.resolve(ip_address)}")
+    print()
+
+    report("arp subprocess", time_calls(resolve_mac_from_ip, ip_address, args.iterations))
+
+    resolver = MacResolver()
+    report("resolver (cold, per call)", time_calls(lambda ip: (resolver.invalidate(), resolver.resolve(ip)),
+                                                    ip_address, args.iterations))
+
+    resolver = MacResolver()
+    resolver.refresh()
+    report("resolver (warm)", time_calls(resolver.resolve, ip_address, args.iterations))
+
+    # Signed identity: every request carries a fresh nonce, as the firmware sends
+    now = str(int(time.time()))
+    mac_address = device_mac(1)
+    requests = [
+        SimpleNamespace(url=SimpleNamespace(path="/device/hit"), headers={
+            device_identity.MAC_HEADER: mac_address,
+            device_identity.TIMESTAMP_HEADER: now,
+            device_identity.NONCE_HEADER: str(i),
+            device_identity.SIGNATURE_HEADER: sign_identity("bench", "/device/hit", mac_address, now, str(i)),
+        })
+        for i in range(args.iterations)
+    ]
+
+    async def verify_all():
+        timings = []
+        for request in requests:
+            start = time.perf_counter()
+            await verify_signed_identity(request, "bench")
+            timings.append((time.perf_counter() - start) * 1_000_000)
+        return timings
+
+    init_schema()
+    device_identity.nonce_cache = NonceCache()
+    report("signed (memory nonces)", asyncio.run(verify_all()))
+    device_identity.nonce_cache = SharedNonceCache()
+    report("signed (shared nonces)", asyncio.run(verify_all()))
+
+
+if __name__ == "__main__":
+    main()
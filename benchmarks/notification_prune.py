@@ -0,0 +1,86 @@
+"""
+Check that change notices published after a prune still reach the other workers.
+
+Each worker remembers the highest change_notices id it has processed and
+the primary deletes notices older than NOTICE_RETENTION_SECONDS. If the
+prune empties the table, a new notice must still get a larger id than any
+deleted one, or every worker silently skips it (and the ones after it).
+
+This records a few expired notices as another process would, starts a
+pruning notification bus, waits for its first poll to delete them, then
+publishes one more notice and fails unless the bus delivers it. It also
+prints how long that took.
+
+Usage:
+    python -m benchmarks.notification_prune [--notices 5]
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+# Imported first so the check runs on a throwaway database
+from benchmarks._harness import device_mac
+
+from sqlalchemy import func, insert, select
+
+from app.models.database import ChangeNotice, async_engine, init_schema
+from app.utils.notifications import NOTICE_RETENTION_SECONDS, NotificationBus
+
+OTHER_PROCESS = 0  # origin of the simulated notices; never our own PID
+
+
+async def record_notice(mac_address, created_at):
+    async with async_engine.begin() as conn:
+        await conn.execute(insert(ChangeNotice).values(
+            origin=OTHER_PROCESS, topic="device", payload=json.dumps({"mac_address": mac_address}),
+            created_at=created_at
+        ))
+
+
+async def count_notices():
+    async with async_engine.connect() as conn:
+        return (await conn.execute(select(func.count()).select_from(ChangeNotice))).scalar()
+
+
+async def check(notices):
+    bus = NotificationBus(enabled=True, interval_ms=50)
+    bus.prune = True
+    received = []
+    bus.on("device", lambda payload: received.append(payload["mac_address"]))
+
+    expired = int(time.time()) - NOTICE_RETENTION_SECONDS * 2
+    for i in range(notices):
+        await record_notice(device_mac(i), expired)
+
+    bus.start()
+    while await count_notices():
+        await asyncio.sleep(0.05)
+    print(f"  pruned {notices} notices; worker has seen up to id {bus._last_id}")
+
+    start = time.perf_counter()
+    await record_notice(device_mac(notices), int(time.time()))
+    while not received and time.perf_counter() - start < 2:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    await bus.stop()
+    await async_engine.dispose()
+    return received, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notices", type=int, default=5, help="Expired notices to prune first")
+    args = parser.parse_args()
+
+    init_schema()
+    received, elapsed = asyncio.run(check(args.notices))
+    if received != [device_mac(args.notices)]:
+        print(f"FAILED: the notice published after the prune was not delivered (received {received})")
+        sys.exit(1)
+    print(f"  notice published after the prune delivered in {elapsed * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Register hundreds of devices at once and check the assigned orders.
+
+Starts the app with uvicorn on a throwaway database and a fake MAC table,
+then sends POST /device/register for every simulated MAC concurrently (as
+when a whole fleet powers up together), followed by a second round from the
+same MACs. Reports registrations per second and fails if any two devices got
+the same order, if the orders are not 1..N, or if a re-registration returned
+a different order.
+
+Usage:
+    python -m benchmarks.registration_storm [--devices 500] [--concurrency 100]
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+# Sets up the throwaway database, so it comes before the app
+from benchmarks._harness import device_ip, start_server, use_fake_mac_table
+
+import httpx
+
+from app.main import app
+
+HTTP_PORT = 8768
+
+
+async def register_all(devices, concurrency):
+    """Register every device with at most `concurrency` requests in flight; return {index: order}"""
+    limits = httpx.Limits(max_connections=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{HTTP_PORT}", limits=limits, timeout=30) as client:
+        async def register(index):
+            async with semaphore:
+                response = await client.post("/device/register", headers={"X-Forwarded-For": device_ip(index)})
+                response.raise_for_status()
+                return index, response.json()["order"]
+        return dict(await asyncio.gather(*(register(i) for i in range(devices))))
+
+
+def run_round(label, devices, concurrency):
+    start = time.perf_counter()
+    orders = asyncio.run(register_all(devices, concurrency))
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<16} {devices / elapsed:>8.1f} registrations/s")
+    return orders
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+
+    use_fake_mac_table(args.devices)
+    server = start_server(app, HTTP_PORT)
+
+    print(f"{args.devices} devices, {args.concurrency} concurrent requests")
+    first = run_round("new devices", args.devices, args.concurrency)
+    second = run_round("re-registration", args.devices, args.concurrency)
+    server.should_exit = True
+
+    problems = []
+    if sorted(first.values()) != list(range(1, args.devices + 1)):
+        duplicates = len(first) - len(set(first.values()))
+        problems.append(f"orders are not 1..{args.devices} ({duplicates} duplicates)")
+    changed = sum(1 for index, order in second.items() if first[index] != order)
+    if changed:
+        problems.append(f"{changed} devices got a different order when registering again")
+
+    if problems:
+        print("FAILED: " + "; ".join(problems))
+        sys.exit(1)
+    print("  orders unique and contiguous")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Benchmark the SQLite storage profile under concurrent readers.
+
+One writer thread increments hit counters the way /device/hit does (UPDATE
+plus commit, with the reset trigger installed) while dashboard readers poll
+the devices table like dashboard/main.py and SSE readers poll like the
+change feed. Each scenario runs once with the "default" profile and once
+with the "performance" profile on a fresh database file.
+
+Usage:
+    python -m benchmarks.sqlite_profile [--devices 20] [--seconds 5]
+                                        [--dashboard-readers 1] [--sse-readers 4]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from sqlalchemy import text
+
+from app.models.database import Base, create_sqlite_engine, create_reset_trigger, sqlite_pragmas
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        with self.lock:
+            self.latencies.append(seconds * 1000)
+
+    def error(self):
+        with self.lock:
+            self.errors += 1
+
+
+def writer(engine, device_count, stop, stats):
+    with engine.connect() as conn:
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                conn.execute(
+                    text("UPDATE devices SET hit_counter = hit_counter + 1 WHERE id = :id"),
+                    {"id": random.randint(1, device_count)},
+                )
+                conn.commit()
+                stats.add(time.perf_counter() - start)
+            except Exception:
+                conn.rollback()
+                stats.error()
+
+
+def dashboard_reader(db_path, profile, stop, stats, interval):
+    # Mirrors DeviceDashboard.fetch_devices: raw sqlite3, full table read
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            conn = sqlite3.connect(db_path)
+            for pragma in sqlite_pragmas(profile):
+                if "journal_mode" not in pragma:
+                    conn.execute(pragma)
+            conn.execute('SELECT "mac_address", "hit_counter", "max_hits", "name" FROM devices ORDER BY "order"').fetchall()
+            conn.close()
+            stats.add(time.perf_counter() - start)
+        except sqlite3.Error:
+            stats.error()
+        time.sleep(interval)
+
+
+def sse_reader(engine, stop, stats, interval):
+    # Mirrors the change feed: data_version check, then a full read
+    with engine.connect() as conn:
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                conn.exec_driver_sql("PRAGMA data_version").scalar()
+                conn.execute(text("SELECT * FROM devices")).fetchall()
+                conn.execute(text("SELECT * FROM users")).fetchall()
+                conn.rollback()
+                stats.add(time.perf_counter() - start)
+            except Exception:
+                conn.rollback()
+                stats.error()
+            time.sleep(interval)
+
+
+def run_scenario(profile, args):
+    tmp_dir = tempfile.mkdtemp(prefix="wsmd-bench-")
+    db_path = os.path.join(tmp_dir, "wsmd.db")
+    engine = create_sqlite_engine(f"sqlite:///{db_path}", profile=profile)
+    Base.metadata.create_all(bind=engine)
+    create_reset_trigger(engine)
+    with engine.begin() as conn:
+        conn.execute(
+            text('INSERT INTO devices (mac_address, hit_counter, max_hits, "order", name) '
+                 'VALUES (:mac, 0, 1000000, :order, :name)'),
+            [{"mac": f"aa:bb:cc:00:{i // 256:02x}:{i % 256:02x}", "order": i, "name": f"Device-{i}"}
+             for i in range(1, args.devices + 1)],
+        )
+
+    stop = threading.Event()
+    stats = {"writer": Stats(), "dashboard": Stats(), "sse": Stats()}
+    threads = [threading.Thread(target=writer, args=(engine, args.devices, stop, stats["writer"]))]
+    threads += [threading.Thread(target=dashboard_reader, args=(db_path, profile, stop, stats["dashboard"], args.dashboard_interval))
+                for _ in range(args.dashboard_readers)]
+    threads += [threading.Thread(target=sse_reader, args=(engine, stop, stats["sse"], args.sse_interval))
+                for _ in range(args.sse_readers)]
+
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    print(f"profile={profile}")
+    for name, stat in stats.items():
+        count = len(stat.latencies)
+        print(f"  {name:<10} {count / args.seconds:>9.1f} ops/s   "
+              f"p50 {percentile(stat.latencies, 0.50):>8.2f} ms   "
+              f"p99 {percentile(stat.latencies, 0.99):>8.2f} ms   errors {stat.errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--dashboard-readers", type=int, default=1)
+    parser.add_argument("--dashboard-interval", type=float, default=0.5)
+    parser.add_argument("--sse-readers", type=int, default=4)
+    parser.add_argument("--sse-interval", type=float, default=0.05)
+    args = parser.parse_args()
+
+    for profile in ("default", "performance"):
+        run_scenario(profile, args)
+
+
+if __name__ == "__main__":
+    main()
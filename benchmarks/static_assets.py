@@ -0,0 +1,77 @@
+"""
+Bytes a browser downloads for the dashboard's static assets per page load.
+
+Builds the assets (python -m app.utils.static_assets does the same) into a
+temporary copy of app/static and serves the page's stylesheet and script
+through the app's static handler, comparing:
+
+    original    /static/... without a build: sent uncompressed, and with
+                no-cache every later page load revalidates each file
+    gzip        fingerprinted .gz variant (Accept-Encoding: gzip)
+    br          fingerprinted .br variant (skipped if brotli is not installed)
+
+For each it shows the bytes of the first page load, the requests a later
+page load makes (none for immutable assets) and the transfer time at the
+given link rate, e.g. a Pi Zero's 2.4 GHz access point under load.
+
+Usage:
+    python -m benchmarks.static_assets [--mbit 5]
+"""
+import argparse
+import shutil
+import tempfile
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.utils.static_assets import STATIC_DIR, PrecompressedStaticFiles, build_assets
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# What dashboard.html links to
+PAGE_ASSETS = ("css/styles.css", "js/dashboard.js")
+
+
+def page_load(client, paths, accept_encoding):
+    """Bytes on the wire for one page load's assets, and whether they may be reused without a request"""
+    total = 0
+    immutable = True
+    for path in paths:
+        response = client.get(f"/static/{path}", headers={"Accept-Encoding": accept_encoding})
+        response.raise_for_status()
+        total += int(response.headers["content-length"])
+        immutable = immutable and "immutable" in response.headers.get("cache-control", "")
+    return total, immutable
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mbit", type=float, default=5.0, help="Effective link rate in Mbit/s")
+    args = parser.parse_args()
+
+    static_dir = tempfile.mkdtemp(prefix="wsmd-bench-")
+    shutil.rmtree(static_dir)
+    shutil.copytree(STATIC_DIR, static_dir, ignore=shutil.ignore_patterns("build"))
+    manifest = build_assets(static_dir)
+
+    app = FastAPI()
+    app.mount("/static", PrecompressedStaticFiles(directory=static_dir), name="static")
+    cases = [("original", PAGE_ASSETS, "identity"), ("gzip", [manifest[p] for p in PAGE_ASSETS], "gzip")]
+    if brotli is not None:
+        cases.append(("br", [manifest[p] for p in PAGE_ASSETS], "br, gzip"))
+
+    print(f"Dashboard assets ({', '.join(PAGE_ASSETS)}) at {args.mbit:g} Mbit/s:")
+    with TestClient(app) as client:
+        for name, paths, accept_encoding in cases:
+            size, immutable = page_load(client, paths, accept_encoding)
+            later = "0 requests" if immutable else f"{len(paths)} revalidations"
+            print(f"  {name:<9} first load {size:7d} bytes {size * 8 / (args.mbit * 1e6) * 1e3:7.1f} ms   "
+                  f"later loads: {later}")
+    shutil.rmtree(static_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Compare hit throughput of the UDP listener against POST /device/hit.
+
+Starts the app with uvicorn on a throwaway database and a fake MAC table,
+registers the simulated devices, then has every device send its hits one
+after another (waiting for each response/ack) over:
+
+- HTTP with a new TCP connection per hit (what the ESP8266 firmware does)
+- HTTP with a kept-alive connection
+- UDP hit packets
+
+Usage:
+    python -m benchmarks.udp_vs_http [--devices 10] [--hits 200]
+"""
+import argparse
+import os
+import socket
+import threading
+import time
+
+# Enable the UDP listener and set up the throwaway database before importing the app
+os.environ.setdefault("WSMD_UDP_PORT", "8766")
+from benchmarks._harness import device_ip, device_mac, start_server, use_fake_mac_table
+
+import httpx
+
+from app.main import app
+from app.utils.udp_ingest import UDP_PORT, encode_hit, decode_ack, ACK_OK
+
+HTTP_PORT = 8765
+
+
+def run_devices(devices, func):
+    """Run func(index) for every device in parallel; return (elapsed seconds, errors)"""
+    errors = []
+    threads = [threading.Thread(target=lambda i=i: errors.extend(func(i))) for i in range(devices)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, len(errors)
+
+
+def http_new_connection(hits):
+    # Raw HTTP/1.1 over a fresh socket per hit, like ESP8266HTTPClient
+    def send(index):
+        errors = []
+        request = (f"POST /device/hit HTTP/1.1\r\nHost: 127.0.0.1:{HTTP_PORT}\r\n"
+                   f"X-Forwarded-For: {device_ip(index)}\r\nContent-Type: application/json\r\n"
+                   f"Content-Length: 4\r\nConnection: close\r\n\r\nnull").encode()
+        for _ in range(hits):
+            with socket.create_connection(("127.0.0.1", HTTP_PORT)) as sock:
+                sock.sendall(request)
+                response = b""
+                while chunk := sock.recv(4096):
+                    response += chunk
+            if not response.startswith(b"HTTP/1.1 200"):
+                errors.append(response[:12])
+        return errors
+    return send
+
+
+def http_keep_alive(hits):
+    def send(index):
+        errors = []
+        with httpx.Client(base_url=f"http://127.0.0.1:{HTTP_PORT}",
+                          headers={"X-Forwarded-For": device_ip(index)}) as client:
+            for _ in range(hits):
+                response = client.post("/device/hit")
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+        return errors
+    return send
+
+
+def udp(hits):
+    def send(index):
+        errors = []
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(1.0)
+        for sequence in range(hits):
+            packet = encode_hit(device_mac(index), sequence)
+            for _ in range(5):  # Retransmit until acked, like the firmware
+                sock.sendto(packet, ("127.0.0.1", UDP_PORT))
+                try:
+                    acked_sequence, ack_status, *_ = decode_ack(sock.recv(64))
+                except socket.timeout:
+                    continue
+                if acked_sequence == sequence:
+                    if ack_status != ACK_OK:
+                        errors.append(ack_status)
+                    break
+            else:
+                errors.append("timeout")
+        sock.close()
+        return errors
+    return send
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--hits", type=int, default=200, help="Hits per device per transport")
+    args = parser.parse_args()
+
+    use_fake_mac_table(args.devices)
+    server = start_server(app, HTTP_PORT)
+
+    for i in range(args.devices):
+        httpx.post(f"http://127.0.0.1:{HTTP_PORT}/device/register", headers={"X-Forwarded-For": device_ip(i)})
+
+    total = args.devices * args.hits
+    print(f"{args.devices} devices x {args.hits} hits")
+    for label, sender in (("HTTP (new connection)", http_new_connection(args.hits)),
+                          ("HTTP (keep-alive)", http_keep_alive(args.hits)),
+                          ("UDP", udp(args.hits))):
+        elapsed, errors = run_devices(args.devices, sender)
+        print(f"  {label:<22} {total / elapsed:>9.1f} hits/s   errors {errors}")
+
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Measure how throughput scales with the number of uvicorn worker processes.
+
+For each worker count the app is started with ``WSMD_WORKERS=<n>`` (as
+``python -m app.main`` would) on a fresh throwaway database with a known
+user and a set of registered devices. Devices identify themselves with
+signed identity headers (WSMD_DEVICE_SECRET), so no ARP table is needed
+whichever worker answers. Several load-generator processes then run a
+closed loop against each scenario:
+
+    hit      POST /device/hit from the registered devices
+    devices  GET /admin/devices with a session cookie
+    login    POST /token with a valid password (bcrypt-bound)
+
+Throughput and p50/p95 latency are reported per scenario and worker count;
+logins refused with 429 by a saturated password pool count as errors.
+More workers only help up to the number of CPU cores; on SQLite, hits are
+bounded by the single writer whatever the worker count.
+
+Usage:
+    python -m benchmarks.workers_scaling [--workers 1,2,4] [--scenarios hit,devices,login]
+                                         [--duration 10] [--clients 4] [--concurrency 8]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+
+from benchmarks.fleet import summarize, wait_for_server
+
+SERVE_PORT = 8770
+USERNAME = "bench"
+PASSWORD = "bench"
+SECRET = "workers-scaling-secret"
+DEVICES = 32
+
+
+def device_mac(index):
+    return f"02:00:00:04:{index // 256:02x}:{index % 256:02x}"
+
+
+def serve(port, workers):
+    """Child process: prepare the database, then run the app like python -m app.main"""
+    from app.models.database import SessionLocal, User, Device, init_schema
+    from app.utils.auth import get_password_hash
+
+    init_schema()
+    db = SessionLocal()
+    db.add(User(username=USERNAME, password_hash=get_password_hash(PASSWORD), is_key_user=True))
+    for index in range(DEVICES):
+        mac_address = device_mac(index)
+        db.add(Device(mac_address=mac_address, order=index + 1, max_hits=100, name=f"bench-{index}"))
+    db.commit()
+    db.close()
+
+    import uvicorn
+
+    uvicorn.run("app.main:app", host="127.0.0.1", port=port, workers=workers, log_level="warning")
+
+
+def identity_headers(path, mac_address):
+    from app.utils.device_identity import sign_identity
+
+    timestamp = str(int(time.time()))
+    nonce = uuid.uuid4().hex
+    return {
+        "X-WSMD-MAC": mac_address,
+        "X-WSMD-Timestamp": timestamp,
+        "X-WSMD-Nonce": nonce,
+        "X-WSMD-Signature": sign_identity(SECRET, path, mac_address, timestamp, nonce),
+    }
+
+
+async def run_client(scenario, base_url, worker_index, concurrency, duration):
+    """Closed loop: concurrency requests in flight until the deadline"""
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=30, limits=limits) as client:
+        if scenario == "devices":
+            await client.post("/token", data={"username": USERNAME, "password": PASSWORD})
+
+        async def loop(slot):
+            nonlocal errors
+            mac_address = device_mac((worker_index * concurrency + slot) % DEVICES)
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    if scenario == "hit":
+                        response = await client.post("/device/hit", headers=identity_headers("/device/hit", mac_address))
+                    elif scenario == "devices":
+                        response = await client.get("/admin/devices")
+                    else:
+                        response = await client.post("/token", data={"username": USERNAME, "password": PASSWORD})
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(loop(slot) for slot in range(concurrency)))
+    return latencies, errors
+
+
+def client_process(args):
+    return asyncio.run(run_client(*args))
+
+
+def measure(scenario, base_url, clients, concurrency, duration):
+    jobs = [(scenario, base_url, index, concurrency, duration) for index in range(clients)]
+    start = time.perf_counter()
+    with multiprocessing.Pool(clients) as pool:
+        results = pool.map(client_process, jobs)
+    elapsed = time.perf_counter() - start
+    latencies = [latency for client_latencies, _ in results for latency in client_latencies]
+    errors = sum(client_errors for _, client_errors in results)
+    return summarize(latencies, errors, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts")
+    parser.add_argument("--scenarios", default="hit,devices,login")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per scenario")
+    parser.add_argument("--clients", type=int, default=4, help="Load-generator processes")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight per load generator")
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--serve", type=int, metavar="WORKERS", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.serve)
+        return
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    scenarios = args.scenarios.split(",")
+    print(f"{os.cpu_count()} CPUs, {args.clients} load generators x {args.concurrency} requests in flight, "
+          f"{args.duration:.0f} s per scenario")
+
+    for workers in [int(value) for value in args.workers.split(",")]:
+        env = dict(os.environ)
+        env["WSMD_WORKERS"] = str(workers)
+        env["WSMD_DEVICE_SECRET"] = SECRET
+        env["WSMD_DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="wsmd-bench-"), "wsmd.db")
+        server = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.workers_scaling", "--serve", str(workers), "--port", str(args.port)],
+            env=env,
+        )
+        try:
+            wait_for_server(base_url, server)
+            for scenario in scenarios:
+                summary = measure(scenario, base_url, args.clients, args.concurrency, args.duration)
+                line = f"  workers={workers:<2} {scenario:<8} {summary['throughput_per_s']:8.1f} req/s   errors {summary['errors']}"
+                if "p50_ms" in summary:
+                    line += f"   p50 {summary['p50_ms']:.1f}  p95 {summary['p95_ms']:.1f} ms"
+                print(line)
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
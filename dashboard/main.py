@@ -4,9 +4,18 @@ import time
 from datetime import datetime
 
 import os
+import queue
 import sqlite3
 from pathlib import Path
 
+# Same database file as the server (defaults to wsmd.db in the project root)
+DATABASE_PATH = os.getenv(
+    "WSMD_DATABASE_PATH",
+    str(Path(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).joinpath("wsmd.db"))
+)
+# How often the refresh thread checks the database for changes
+POLL_INTERVAL_MS = int(os.getenv("WSMD_DASHBOARD_POLL_INTERVAL_MS", "50"))
+
 large_font = ("Arial", 96, "bold")
 medium_font = ("Arial", 64)
 small_font = ("Arial", 32)
@@ -16,14 +25,22 @@ common_fg = "white"
 
 
 class DeviceDashboard:
-    def __init__(self, root):
+    def __init__(self, root, start_refresh=True):
         self.root = root
         self.setup_ui()
         self.devices = []
-        self.last_data_hash = None  # For tracking changes
+        self.last_devices = None  # Last table read by the refresh thread
+        self.conn = None
+        self.data_version = None
+        
+        # The refresh thread never touches widgets; it posts updates to this queue
+        self.ui_queue = queue.Queue()
         
         # Start the refresh thread
-        self.running = True
+        self.running = start_refresh
+        if not start_refresh:
+            return
+        self.root.after(POLL_INTERVAL_MS, self.process_ui_queue)
         self.thread = threading.Thread(target=self.refresh_thread)
         self.thread.daemon = True
         self.thread.start()
@@ -121,8 +138,18 @@ class DeviceDashboard:
         # Configure grid
         self.table_frame.grid_columnconfigure(0, weight=1)  # First column
         
-        # We'll use the table_frame directly for the device data
-        # No need for a separate devices_frame
+        # Device columns are created once per MAC address and then only updated
+        self.device_columns = {}  # mac_address -> {"column": index, label name -> tk.Label}
+        self.column_count = 1
+        self.no_devices_label = tk.Label(
+            self.table_frame,
+            text="No devices found",
+            font=large_font,
+            fg=common_fg,
+            bg=common_bg,
+            padx=10,
+            pady=20
+        )
         
         # Status bar
         status_frame = tk.Frame(self.root, bg=common_bg, height=30)
@@ -148,150 +175,172 @@ class DeviceDashboard:
         self.time_label.config(text=current_time)
         self.root.after(1000, self.update_time)
     
+    def create_cell(self, text, row, column, padding=10):
+        """Create and grid one label of a device column"""
+        label = tk.Label(
+            self.table_frame,
+            text=text,
+            font=large_font,
+            fg=common_fg,
+            bg=common_bg,
+            borderwidth=0,
+            relief="flat",
+            padx=padding,
+            pady=padding
+        )
+        label.grid(row=row, column=column, sticky="nsew")
+        return label
+    
+    def add_device_column(self, device, col_index):
+        """Create the persistent labels for a newly seen device"""
+        column = {
+            "column": col_index,
+            "name": self.create_cell(device.get("name") or device["mac_address"], 0, col_index, padding=5),
+            "hit_counter": self.create_cell(str(device["hit_counter"]), 1, col_index),
+            "max_hits": self.create_cell(str(device["max_hits"]), 2, col_index),
+            "no_hit": self.create_cell("", 3, col_index)
+        }
+        self.table_frame.grid_columnconfigure(col_index, weight=1)
+        self.device_columns[device["mac_address"]] = column
+    
+    def remove_device_column(self, mac_address):
+        """Destroy the labels of a device that disappeared"""
+        column = self.device_columns.pop(mac_address)
+        for key in ("name", "hit_counter", "max_hits", "no_hit"):
+            column[key].destroy()
+    
     def update_device_table(self):
-        """Update the device table with current data"""
-        # Clear existing device data (keep the first column with labels)
-        for widget in self.table_frame.winfo_children():
-            grid_info = widget.grid_info()
-            if grid_info and int(grid_info["column"]) > 0:
-                widget.destroy()
+        """Update the device table with current data
+        
+        Labels are kept per MAC address and only their text is changed, so a
+        hit only touches the one label whose value changed. Columns are
+        created or destroyed only when devices appear or disappear.
+        """
+        current_macs = {device["mac_address"] for device in self.devices}
+        for mac_address in [mac for mac in self.device_columns if mac not in current_macs]:
+            self.remove_device_column(mac_address)
         
         if not self.devices:
             # Show "No devices" message
-            no_devices_label = tk.Label(
-                self.table_frame,
-                text="No devices found",
-                font=large_font,
-                fg=common_fg,
-                bg=common_bg,
-                padx=10,
-                pady=20
-            )
-            no_devices_label.grid(row=0, column=1, rowspan=3, sticky="nsew")
-            return
-        
-        # Configure columns for devices
-        for i in range(len(self.devices)):
-            self.table_frame.grid_columnconfigure(i+1, weight=1)
-        
+            self.no_devices_label.grid(row=0, column=1, rowspan=3, sticky="nsew")
+        else:
+            self.no_devices_label.grid_remove()
         
-        # Create columns for each device
         for i, device in enumerate(self.devices):
             col_index = i + 1  # Start from column 1 (column 0 has labels)
+            column = self.device_columns.get(device["mac_address"])
+            if column is None:
+                self.add_device_column(device, col_index)
+                continue
             
-            # Device Name/MAC as header (row 0)
-            device_name = device.get("name") or device["mac_address"]
-            device_label = tk.Label(
-                self.table_frame,
-                text=device_name,
-                font=large_font,
-                fg=common_fg,
-                bg=common_bg,
-                borderwidth=0,
-                relief="flat",
-                padx=5,
-                pady=5
-            )
-            device_label.grid(row=0, column=col_index, sticky="nsew")
-            
-            # Hit counter (row 1)
-            hit_label = tk.Label(
-                self.table_frame,
-                text=str(device["hit_counter"]),
-                font=large_font,
-                fg=common_fg,
-                bg=common_bg,
-                padx=10,
-                pady=10
-            )
-            hit_label.grid(row=1, column=col_index, sticky="nsew")
-            
-            # Max hits (row 2)
-            max_hit_label = tk.Label(
-                self.table_frame,
-                text=str(device["max_hits"]),
-                font=large_font,
-                fg=common_fg,
-                bg=common_bg,
-                padx=10,
-                pady=10
-            )
-            max_hit_label.grid(row=2, column=col_index, sticky="nsew")
+            if column["column"] != col_index:
+                # Device order changed: move the existing labels
+                for key in ("name", "hit_counter", "max_hits", "no_hit"):
+                    column[key].grid_configure(column=col_index)
+                column["column"] = col_index
             
-            # Highlight row if over limit
-            no_hit_label = tk.Label(
-                self.table_frame,
-                text="",
-                font=large_font,
-                fg=common_fg,
-                bg=common_bg,
-                padx=10,
-                pady=10
-            )
-            no_hit_label.grid(row=3, column=col_index, sticky="nsew")
+            texts = {
+                "name": device.get("name") or device["mac_address"],
+                "hit_counter": str(device["hit_counter"]),
+                "max_hits": str(device["max_hits"])
+            }
+            for key, text in texts.items():
+                if column[key].cget("text") != text:
+                    column[key].config(text=text)
+        
+        # Columns left over from devices that disappeared no longer take space
+        for col_index in range(len(self.devices) + 1, self.column_count + 1):
+            self.table_frame.grid_columnconfigure(col_index, weight=0)
+        self.column_count = max(len(self.devices), 1)
+    
+    def open_connection(self):
+        """Open the persistent read-only connection to the server's database"""
+        conn = sqlite3.connect(f"file:{DATABASE_PATH}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row  # This enables column access by name
+        return conn
     
     def fetch_devices(self):
-        """Fetch device data directly from the SQLite database"""
+        """Read the devices table if the database changed since the last check
+        
+        PRAGMA data_version only changes when another connection commits, so
+        an idle poll costs one cheap pragma instead of a new connection and a
+        full table read.
+        """
         try:
-            # Determine the path to the database file
-            # Assuming the database is in the root of the project
-            db_path = Path(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).joinpath("wsmd.db")
+            if self.conn is None:
+                self.conn = self.open_connection()
+                self.data_version = None
             
-            # Connect to the SQLite database
-            conn = sqlite3.connect(db_path)
-            conn.row_factory = sqlite3.Row  # This enables column access by name
-            cursor = conn.cursor()
+            data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self.data_version:
+                return False  # Nothing committed since the last read
             
             # Execute the SQL query - include all needed columns and sort by order
-            cursor.execute('SELECT "mac_address", "hit_counter", "max_hits", "name" FROM devices ORDER BY "order"')
-
+            cursor = self.conn.execute('SELECT "mac_address", "hit_counter", "max_hits", "name" FROM devices ORDER BY "order"')
+            
             # Convert to list of dictionaries
-            new_devices = []
-            for row in cursor.fetchall():
-                new_devices.append({
+            new_devices = [
+                {
                     "mac_address": row["mac_address"],
                     "hit_counter": row["hit_counter"],
                     "max_hits": row["max_hits"],
                     "name": row["name"],
-                })
-            
-            # Close the connection
-            conn.close()
+                }
+                for row in cursor.fetchall()
+            ]
+            self.data_version = data_version
             
-            # Generate a hash of the new data
-            new_data_hash = hash(str(new_devices))
-            
-            # Only update the UI and status if data has changed
-            if new_data_hash != self.last_data_hash:
-                self.devices = new_devices
-                self.last_data_hash = new_data_hash
-                self.status_label.config(
-                    text=f"{len(self.devices)} devices found"
-                )
-                # Force an immediate UI update when data changes
-                self.root.after(0, self.update_device_table)
+            # Only update the UI if the rows we display have changed
+            if new_devices != self.last_devices:
+                self.last_devices = new_devices
+                self.ui_queue.put(("devices", new_devices))
                 return True  # Data changed
             return False  # No change in data
             
         except Exception as e:
-            self.status_label.config(
-                text=f"Error connecting to database: {str(e)}"
-            )
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+            self.ui_queue.put(("status", f"Error connecting to database: {str(e)}"))
             return False  # Error occurred
     
+    def process_ui_queue(self):
+        """Apply updates posted by the refresh thread (runs on the Tk thread)"""
+        devices = None
+        try:
+            while True:
+                kind, payload = self.ui_queue.get_nowait()
+                if kind == "devices":
+                    devices = payload  # Only the newest table matters
+                    self.status_label.config(text=f"{len(payload)} devices found")
+                else:
+                    self.status_label.config(text=payload)
+        except queue.Empty:
+            pass
+        
+        if devices is not None:
+            self.devices = devices
+            self.update_device_table()
+        
+        if self.running:
+            self.root.after(POLL_INTERVAL_MS, self.process_ui_queue)
+    
     def refresh_thread(self):
         """Background thread to refresh data periodically"""
         while self.running:
             try:
-                # Fetch new data - will only update UI if data changed
+                # Fetch new data - will only post an update if data changed
                 self.fetch_devices()
                 
-                # Wait for next refresh - shorter interval for more responsive updates
-                time.sleep(0.5)  # Check twice per second for near real-time updates
+                # Wait for next check - an unchanged database costs a single pragma
+                time.sleep(POLL_INTERVAL_MS / 1000)
             except Exception as e:
                 # Handle any unexpected errors to prevent thread from crashing
                 print(f"Error in refresh thread: {str(e)}")
                 time.sleep(1)  # Wait a bit longer if there was an error
+        
+        if self.conn is not None:
+            self.conn.close()
     
     def exit_application(self, event=None):
         """Exit the application"""
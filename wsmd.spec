@@ -68,7 +68,9 @@ a = Analysis(
         'uvicorn.protocols.websockets.auto',
         'uvicorn.protocols.websockets.wsproto_implementations',
         'uvicorn.protocols.websockets.websockets_implementations',
-        'email.mime.image'
+        'email.mime.image',
+        'aiosqlite',
+        'sqlalchemy.dialects.sqlite.aiosqlite'
     ],
     hookspath=[],
     hooksconfig={},
@@ -93,7 +95,8 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    # No UPX: the bundle is unpacked on every start and decompressing it is slow on a Pi Zero
+    upx=False,
     upx_exclude=[],
     runtime_tmpdir=None,
     console=True,